@@ -1,9 +1,12 @@
 from flask import Flask, request, jsonify
-from openai import OpenAI
+from openai import APIError, OpenAI
 from flask_cors import CORS
 import os
-import PyPDF2
-from io import BytesIO
+from services.text_service import get_pages_from_bytes
+from services.context_builder import build_context_from_pages
+from services.answer_engine import (
+    ANSWER_ENGINE, ENGINES, LLM_FALLBACK_TIMEOUT, context_passages, extract_answer, is_simple_lookup
+)
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for cross-origin requests
@@ -19,6 +22,15 @@ client = OpenAI(
     base_url=OPENAI_ENDPOINT
 )
 
+def extractive_response(extracted, context):
+    return jsonify({
+        "response": extracted["answer"],
+        "engine": "extractive",
+        "citations": extracted["citations"],
+        "context_tokens": context["tokens"],
+        "status": "success"
+    }), 200
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     try:
@@ -32,6 +44,13 @@ def chat():
         # Get uploaded file and message
         file = request.files['context_file']
         user_input = request.form['message']
+        # Answer engine: llm, extractive or auto (see services/answer_engine.py)
+        engine = request.form.get('engine') or ANSWER_ENGINE
+        if engine not in ENGINES:
+            return jsonify({
+                "error": f"Unknown answer engine '{engine}' (expected one of {', '.join(ENGINES)})",
+                "status": "error"
+            }), 400
 
         # Validate file extension
         if not file.filename.lower().endswith(('.txt', '.pdf')):
@@ -48,15 +67,10 @@ def chat():
 
         # Read context based on file extension
         try:
-            if file.filename.lower().endswith('.txt'):
-                DOCUMENT_CONTEXT = file.read().decode('utf-8')
-            elif file.filename.lower().endswith('.pdf'):
-                pdf_reader = PyPDF2.PdfReader(BytesIO(file.read()))
-                DOCUMENT_CONTEXT = ""
-                for page in pdf_reader.pages:
-                    extracted_text = page.extract_text()
-                    if extracted_text:
-                        DOCUMENT_CONTEXT += extracted_text + "\n"
+            # Extracted text is cached by content hash, so re-sent files are not parsed again;
+            # headers/footers are dropped and the most relevant parts packed into the token budget
+            context = build_context_from_pages(get_pages_from_bytes(file.read(), file.filename), user_input)
+            DOCUMENT_CONTEXT = context["text"]
             
             if not DOCUMENT_CONTEXT.strip():
                 return jsonify({
@@ -69,6 +83,13 @@ def chat():
                 "status": "error"
             }), 500
 
+        # Local answer: the whole reply for "extractive", the fast path or the fallback for "auto"
+        extracted = None
+        if engine != "llm":
+            extracted = extract_answer(user_input, context_passages(context))
+            if engine == "extractive" or is_simple_lookup(user_input, extracted):
+                return extractive_response(extracted, context)
+
         # Combine user input with document context for LLM
         prompt = (
             f"You are an assistant that answers questions based solely on the following document content:\n\n"
@@ -79,21 +100,32 @@ def chat():
         )
 
         # Call OpenAI API
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant restricted to the provided document context."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=500,
-            temperature=0.7
-        )
+        # Under "auto" a slow or failing LLM is not retried: the local answer is ready
+        llm = client.with_options(timeout=LLM_FALLBACK_TIMEOUT, max_retries=0) if extracted is not None else client
+        try:
+            response = llm.chat.completions.create(
+                model=MODEL_NAME,
+                messages=[
+                    {"role": "system", "content": "You are a helpful assistant restricted to the provided document context."},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=500,
+                temperature=0.7
+            )
+        except APIError as e:
+            if extracted is None:
+                raise
+            app.logger.warning("LLM answer failed (%r), falling back to the extractive answer", e)
+            return extractive_response(extracted, context)
 
         # Extract response
         llm_response = response.choices[0].message.content
 
         return jsonify({
             "response": llm_response,
+            "engine": "llm",
+            "citations": [],
+            "context_tokens": context["tokens"],
             "status": "success"
         }), 200
 
@@ -0,0 +1,400 @@
+# benchmarks/bench.py
+#
+# Reproducible latency/throughput benchmarks for ingest, retrieval and chat.
+#
+#   python -m benchmarks.bench --scale 1k --output bench_results.json
+#   python -m benchmarks.bench --scale 10k --baseline bench_results.json
+#
+# The FastAPI app is driven in-process (httpx ASGI transport) inside a throwaway
+# working directory, against the stub OpenAI-compatible server from scripts/.
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000}
+
+# Lower is better for latency, higher is better for throughput
+COMPARED_METRICS = {"p95_ms": "lower", "throughput": "higher"}
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def peak_rss_mb() -> dict:
+    # ru_maxrss is in KiB on Linux; children covers the ingest process pool
+    to_mb = 1 / 1024 if sys.platform != "darwin" else 1 / (1024 * 1024)
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * to_mb, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * to_mb, 1)
+    }
+
+def summarize(latencies: list, wall: float, errors: int) -> dict:
+    ms = [value * 1000 for value in latencies]
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        "max_ms": round(max(ms), 3) if ms else 0.0,
+        "wall_s": round(wall, 3),
+        "throughput": round(len(latencies) / wall, 2) if wall else 0.0,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+async def run_scenario(name: str, operations: list, concurrency: int) -> dict:
+    # Each operation is a zero-argument coroutine function; a falsy result counts as an error
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def timed(operation):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                ok = await operation()
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(operation) for operation in operations))
+    result = summarize(latencies, time.perf_counter() - started, errors)
+    print_result(name, result)
+    return result
+
+def print_result(name: str, result: dict):
+    print(f"  {name:<14} n={result['count']:<6} p50={result['p50_ms']:>9.2f}ms "
+          f"p95={result['p95_ms']:>9.2f}ms p99={result['p99_ms']:>9.2f}ms "
+          f"{result['throughput']:>9.1f}/s errors={result['errors']}", flush=True)
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_stub_llm(port: int):
+    import uvicorn
+    from scripts.stub_llm_server import app as stub_app
+    server = uvicorn.Server(uvicorn.Config(stub_app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except Exception:
+        return "unknown"
+
+def measure_startup(runs: int) -> dict:
+    # Cold starts of a real server process in the benchmark directory (so against the corpus
+    # built by the other scenarios): time until liveness and until readiness answer 200
+    import httpx
+    env = {**os.environ, "PYTHONPATH": BACKEND_DIR}
+    live, ready, errors = [], [], 0
+    started = time.perf_counter()
+    for _ in range(runs):
+        port = free_port()
+        base = f"http://127.0.0.1:{port}/api/health"
+        launched = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        live_at = ready_at = None
+        try:
+            while ready_at is None and process.poll() is None and time.perf_counter() - launched < 60:
+                try:
+                    if live_at is None and httpx.get(f"{base}/live").status_code == 200:
+                        live_at = time.perf_counter()
+                    if live_at is not None and httpx.get(f"{base}/ready").status_code == 200:
+                        ready_at = time.perf_counter()
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.005)
+        finally:
+            process.terminate()
+            process.wait()
+        if ready_at is None:
+            errors += 1
+            continue
+        live.append(live_at - launched)
+        ready.append(ready_at - launched)
+    wall = time.perf_counter() - started
+    return {"startup_live": summarize(live, wall, errors), "startup_ready": summarize(ready, wall, errors)}
+
+def seed_documents(start: int, count: int, seed: int) -> float:
+    # Bulk-loads documents straight into the store and index, bypassing HTTP, so that
+    # list/retrieval scenarios can run against large corpora in reasonable time
+    from models.document import Document, DocumentVersion
+    from services import context_builder, index_service
+    from services.file_service import UPLOAD_DIR, documents_db, versions_db, transaction
+    from services.text_service import hash_bytes
+    from benchmarks.corpus import make_document
+
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    batch = []
+    for doc_no in range(start, start + count):
+        file_name, content, pages = make_document(doc_no, seed, pdf_ratio=0)
+        doc = Document(f"Document {doc_no}", file_name, [rng.choice(["hr", "finance", "legal", "ops"])],
+                       rng.choice(["en", "vi"]), rng.choice(["general", "manual", "policy"]), "bench",
+                       status="indexed")
+        file_path = os.path.join(UPLOAD_DIR, f"{doc.id}_{file_name}")
+        with open(file_path, "wb") as f:
+            f.write(content)
+        version = DocumentVersion(doc.id, 1, file_path, hash_bytes(content), embedded=True)
+        doc.versions.append(version.id)
+        batch.append((doc, version, pages))
+        if len(batch) == 500 or doc_no == start + count - 1:
+            with transaction():
+                for doc, version, _ in batch:
+                    documents_db[doc.id] = doc
+                    versions_db[version.id] = version
+            for _, version, pages in batch:
+                text = "\n".join(context_builder.strip_boilerplate(pages))
+                index_service.index_chunks(version, index_service.chunk_text(text))
+            batch = []
+    return time.perf_counter() - started
+
+async def run_benchmarks(args) -> dict:
+    import httpx
+    import main
+    from benchmarks.corpus import make_document, make_questions
+    from models.document import Document, DocumentVersion
+    from services.file_service import save_document, documents_db
+
+    scenarios = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            # The store is prepared in the background; wait for readiness like a load balancer would
+            while (await client.get("/api/health/ready")).status_code != 200:
+                await asyncio.sleep(0.01)
+            rng = random.Random(args.seed)
+            uploads = min(args.uploads, args.docs)
+
+            # DB persistence: one document + version upsert per operation
+            async def db_write():
+                doc = Document("bench", "bench.txt", ["bench"], "en", "general", "bench")
+                version = DocumentVersion(doc.id, 1, "./uploaded_files/missing.txt", "0" * 64)
+                doc.versions.append(version.id)
+                save_document(doc, version)
+                return documents_db[doc.id] is not None
+            scenarios["db_write"] = await run_scenario("db_write", [db_write] * args.ops, 1)
+
+            # Upload through HTTP (returns once stored and queued)
+            uploaded = []
+
+            def upload_op(doc_no):
+                async def op():
+                    file_name, content, _ = make_document(doc_no, args.seed)
+                    response = await client.post(
+                        "/api/files/upload",
+                        files={"file": (file_name, content)},
+                        data={"title": f"Document {doc_no}", "tags": rng.choice(["hr", "finance", "legal", "ops"]),
+                              "category": rng.choice(["general", "manual", "policy"])}
+                    )
+                    if response.status_code == 200:
+                        uploaded.append(response.json()["document_id"])
+                    return response.status_code == 200
+                return op
+            scenarios["upload"] = await run_scenario("upload", [upload_op(i) for i in range(uploads)], args.concurrency)
+
+            # Background ingestion of everything uploaded above
+            started = time.perf_counter()
+            pending = set(uploaded)
+            while pending:
+                await asyncio.sleep(0.05)
+                pending = {d for d in pending if documents_db[d].status not in ("indexed", "failed")}
+            wall = time.perf_counter() - started
+            scenarios["ingest"] = {**summarize([wall], wall, 0), "throughput": round(len(uploaded) / wall, 2) if wall else 0.0}
+            print(f"  {'ingest':<14} {len(uploaded)} documents indexed in {wall:.2f}s", flush=True)
+
+            if args.docs > uploads:
+                seconds = await asyncio.to_thread(seed_documents, uploads, args.docs - uploads, args.seed)
+                print(f"  seeded {args.docs - uploads} documents directly in {seconds:.1f}s", flush=True)
+
+            async def list_op():
+                params = {"limit": 50}
+                choice = rng.random()
+                if choice < 0.3:
+                    params["category"] = rng.choice(["general", "manual", "policy"])
+                elif choice < 0.6:
+                    params["tags"] = rng.choice(["hr", "finance", "legal", "ops"])
+                response = await client.get("/api/files", params=params)
+                if response.status_code != 200:
+                    return False
+                cursor = response.json()["next_cursor"]
+                if cursor:
+                    response = await client.get("/api/files", params={**params, "cursor": cursor})
+                return response.status_code == 200
+            scenarios["list"] = await run_scenario("list", [list_op] * args.ops, args.concurrency)
+
+            async def preview_op():
+                doc_id = rng.choice(uploaded)
+                choice = rng.random()
+                if choice < 0.4:
+                    response = await client.get(f"/api/files/{doc_id}/preview")
+                elif choice < 0.7:
+                    response = await client.get(f"/api/files/{doc_id}/preview", headers={"Range": "bytes=0-1023"})
+                else:
+                    response = await client.get(f"/api/files/{doc_id}/preview", params={"mode": "text"})
+                return response.status_code in (200, 206)
+            if uploaded:
+                scenarios["preview"] = await run_scenario("preview", [preview_op] * args.ops, args.concurrency)
+
+            def chat_file_op(doc_no):
+                async def op():
+                    file_name, content, _ = make_document(doc_no, args.seed + 1)
+                    response = await client.post(
+                        "/api/chat",
+                        data={"message": f"What is the reference code of document {doc_no}?"},
+                        files={"context_file": (file_name, content)}
+                    )
+                    return response.status_code == 200
+                return op
+            scenarios["chat_file"] = await run_scenario(
+                "chat_file", [chat_file_op(args.docs + i) for i in range(args.chat_ops)], args.concurrency
+            )
+
+            questions = make_questions(args.docs, args.chat_ops, args.seed)
+
+            def chat_corpus_op(question, engine="llm"):
+                async def op():
+                    response = await client.post("/api/chat", data={"message": question, "engine": engine})
+                    return response.status_code == 200
+                return op
+            scenarios["chat_corpus"] = await run_scenario(
+                "chat_corpus", [chat_corpus_op(q) for q in questions], args.concurrency
+            )
+            # Same questions answered by the local extractive engine, without the LLM
+            scenarios["chat_extractive"] = await run_scenario(
+                "chat_extractive", [chat_corpus_op(q, "extractive") for q in questions], args.concurrency
+            )
+
+    if args.startup_runs:
+        startup = await asyncio.to_thread(measure_startup, args.startup_runs)
+        for name, result in startup.items():
+            print_result(name, result)
+        scenarios.update(startup)
+    return scenarios
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    # Returns a list of human-readable regressions
+    regressions = []
+    print(f"\n{'scenario':<14} {'metric':<11} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for metric, better in COMPARED_METRICS.items():
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change > threshold if better == "lower" else change < -threshold
+            flag = "  REGRESSION" if worse else ""
+            print(f"{name:<14} {metric:<11} {old:>12.2f} {new:>12.2f} {change:>+8.1%}{flag}")
+            if worse:
+                regressions.append(f"{name}.{metric}: {old} -> {new} ({change:+.1%})")
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="RAG File CMS benchmarks")
+    parser.add_argument("--scale", choices=sorted(SCALES), help="Corpus size preset (overrides --docs)")
+    parser.add_argument("--docs", type=int, default=1_000, help="Total documents in the corpus")
+    parser.add_argument("--uploads", type=int, default=200, help="Documents uploaded over HTTP; the rest are bulk-seeded")
+    parser.add_argument("--ops", type=int, default=300, help="Operations per list/preview/db scenario")
+    parser.add_argument("--chat-ops", type=int, default=100, help="Operations per chat scenario")
+    parser.add_argument("--startup-runs", type=int, default=5, help="Cold server starts to time (0 to skip)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="Stub LLM latency in seconds")
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the answer cache enabled")
+    parser.add_argument("--workdir", help="Working directory (default: a new temp dir)")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="Previous results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative regression (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+    if args.scale:
+        args.docs = SCALES[args.scale]
+    return args
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    workdir = args.workdir or tempfile.mkdtemp(prefix="cms-bench-")
+    os.makedirs(workdir, exist_ok=True)
+
+    # Configuration is read at import time, so set it before importing the app
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(BACKEND_DIR)
+    os.environ["STUB_LLM_DELAY"] = str(args.llm_delay)
+    port = free_port()
+    server = start_stub_llm(port)
+    os.environ["OPENAI_ENDPOINT"] = f"http://127.0.0.1:{port}"
+    if not args.answer_cache:
+        os.environ["ANSWER_CACHE_SIZE"] = "0"
+    os.chdir(workdir)
+
+    print(f"Benchmarking {args.docs} documents in {workdir}", flush=True)
+    started = time.perf_counter()
+    scenarios = asyncio.run(run_benchmarks(args))
+    server.should_exit = True
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "docs": args.docs,
+            "uploads": min(args.uploads, args.docs),
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "llm_delay": args.llm_delay,
+            "total_s": round(time.perf_counter() - started, 2)
+        },
+        "scenarios": scenarios
+    }
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print("\nRegressions beyond threshold:\n  " + "\n  ".join(regressions))
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
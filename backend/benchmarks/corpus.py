@@ -0,0 +1,92 @@
+# benchmarks/corpus.py
+#
+# Deterministic synthetic documents (TXT and PDF) for the benchmark suite.
+
+import random
+
+WORDS = (
+    "access account address agreement analysis annual application approval asset audit balance "
+    "benefit budget business capital claim client company compliance contract cost customer data "
+    "delivery department design development device document employee energy equipment finance "
+    "function growth health incident insurance inventory invoice legal license maintenance manager "
+    "market network office operation order partner payment performance policy process product "
+    "project quality record region report request resource revenue review risk safety sales "
+    "schedule security service software staff standard storage supplier support system team "
+    "technology training transfer travel update vendor warranty"
+).split()
+
+def make_sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 18))]
+    return " ".join(words).capitalize() + "."
+
+def make_pages(doc_no: int, page_count: int, rng: random.Random) -> list:
+    # Every page carries the same header/footer, like real exported manuals
+    pages = []
+    for page_no in range(1, page_count + 1):
+        lines = [f"Synthetic Corp - Document {doc_no}"]
+        for _ in range(rng.randint(12, 20)):
+            lines.append(make_sentence(rng))
+        if page_no == 1:
+            # A unique fact per document so retrieval quality can be checked
+            lines.append(f"The reference code of document {doc_no} is REF{doc_no:06d}.")
+        lines.append(f"Page {page_no} of {page_count}")
+        pages.append(lines)
+    return pages
+
+def pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def make_pdf(pages: list) -> bytes:
+    # Minimal valid PDF: one Helvetica text stream per page
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    page_refs = []
+    for lines in pages:
+        stream = ["BT", "/F1 10 Tf", "12 TL", "40 800 Td"]
+        for line in lines:
+            stream.append(f"({pdf_escape(line)}) Tj T*")
+        stream.append("ET")
+        content = "\n".join(stream).encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        page_refs.append(len(objects))
+    kids = " ".join(f"{ref} 0 R" for ref in page_refs).encode()
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_refs)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return bytes(out)
+
+def make_document(doc_no: int, seed: int = 0, pdf_ratio: float = 0.3, max_pages: int = 4) -> tuple:
+    # Returns (file_name, content bytes, page texts)
+    rng = random.Random(seed * 1_000_003 + doc_no)
+    pages = make_pages(doc_no, rng.randint(1, max_pages), rng)
+    page_texts = ["\n".join(lines) for lines in pages]
+    if rng.random() < pdf_ratio:
+        return f"doc_{doc_no:06d}.pdf", make_pdf(pages), page_texts
+    return f"doc_{doc_no:06d}.txt", "\n".join(page_texts).encode("utf-8"), page_texts
+
+def make_questions(doc_count: int, count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    questions = []
+    for _ in range(count):
+        if rng.random() < 0.5:
+            questions.append(f"What is the reference code of document {rng.randrange(doc_count)}?")
+        else:
+            questions.append(f"How does the {rng.choice(WORDS)} {rng.choice(WORDS)} process work?")
+    return questions
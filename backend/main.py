@@ -1,15 +1,41 @@
 # main.py
 
-from fastapi import FastAPI
+import os
+import time
+import random
+import cProfile
+import threading
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
 from routes.files import router as file_router
 from routes.chat import router as chat_router
+from routes.ingest import router as ingest_router
+from routes.health import router as health_router
+from services import answer_cache, ingest_service, lifecycle, metrics
+
+# Sampled profiling: a fraction of requests run under cProfile, slow ones are dumped to PROFILE_DIR
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "1000"))
+PROFILE_DIR = "./profiles"
+
+_profile_lock = threading.Lock()  # cProfile allows one active profiler per process
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Returns at once so liveness probes are answered while the store is prepared in the
+    # background; /api/health/ready reports when that is done
+    lifecycle.start()
+    yield
+    await lifecycle.stop()
 
 app = FastAPI(
     title="RAG File CMS API",
     description="API for uploading, previewing, and managing files for RAG training",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS configuration (adjust origins as needed)
@@ -21,9 +47,58 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Include file management API routes
-app.include_router(file_router, prefix="/api/files", tags=["File Management"])
-app.include_router(chat_router, prefix="/api", tags=["Chat"])
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    timings = []
+    token = metrics.request_timings.set(timings)
+    profiler = None
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE and _profile_lock.acquire(blocking=False):
+        # cProfile hooks the event loop thread, not this request: other requests served
+        # concurrently show up in the profile, while sync (def) routes and to_thread work run
+        # in the threadpool and do not. Profiles are most useful with little concurrent load.
+        profiler = cProfile.Profile()
+        profiler.enable()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - started
+        if profiler is not None:
+            profiler.disable()
+            _profile_lock.release()
+        metrics.request_timings.reset(token)
+        # Label by endpoint name, not raw path, to keep the series count bounded
+        route = request.scope.get("route")
+        handler = getattr(route, "name", None) or "unmatched"
+        metrics.request_seconds.observe(elapsed, method=request.method, handler=handler, status=status)
+        if profiler is not None and elapsed * 1000 >= PROFILE_SLOW_MS:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{int(time.time() * 1000)}-{handler}.prof"))
+            metrics.slow_profiles.inc(handler=handler)
+    response.headers["Server-Timing"] = metrics.server_timing_header(timings, elapsed)
+    return response
+
+metrics.register(metrics.CallbackGauge(
+    "cms_answer_cache", "Answer cache statistics",
+    lambda: [({"stat": key}, value) for key, value in answer_cache.get_stats().items()]
+))
+metrics.register(metrics.CallbackGauge(
+    "cms_ingest_versions", "Ingestion progress since process start",
+    lambda: [({"state": key}, value) for key, value in ingest_service.progress.items()]
+))
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Include file management API routes; they answer 503 until startup has finished
+ready = [Depends(lifecycle.require_ready)]
+app.include_router(file_router, prefix="/api/files", tags=["File Management"], dependencies=ready)
+app.include_router(chat_router, prefix="/api", tags=["Chat"], dependencies=ready)
+app.include_router(ingest_router, prefix="/api/ingest", tags=["Ingestion"], dependencies=ready)
+app.include_router(health_router, prefix="/api/health", tags=["Health"])
 
 # Optional: custom Swagger UI path
 @app.get("/docs", include_in_schema=False)
@@ -1,24 +1,52 @@
 # models/document.py
 
+import sys
 from uuid import uuid4
-from datetime import datetime
+from datetime import datetime, timezone
+
+def intern(value):
+    # Tags, categories, languages and statuses repeat across many rows; share one string each
+    return sys.intern(value) if type(value) is str else value
+
+def format_datetime(value: datetime) -> str:
+    # Naive UTC, fixed width, so stored values sort as text and parse back exactly
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(sep=" ", timespec="microseconds")
+
+def parse_datetime(value):
+    if value is None:
+        return None
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
 
 class Document:
+    __slots__ = ("id", "title", "file_name", "tags", "language", "category", "uploaded_by",
+                 "created_at", "updated_at", "versions", "status")
+
     def __init__(self, title, file_name, tags, language, category, uploaded_by,
                  id=None, created_at=None, updated_at=None, versions=None, status='uploaded'):
         self.id = id or str(uuid4())
         self.title = title
         self.file_name = file_name
-        self.tags = tags
-        self.language = language
-        self.category = category
-        self.uploaded_by = uploaded_by
-        self.created_at = created_at or datetime.utcnow()
-        self.updated_at = updated_at or self.created_at
+        self.tags = [intern(tag) for tag in tags]
+        self.language = intern(language)
+        self.category = intern(category)
+        self.uploaded_by = intern(uploaded_by)
+        self.created_at = parse_datetime(created_at) or datetime.utcnow()
+        self.updated_at = parse_datetime(updated_at) or self.created_at
         self.versions = versions or []
-        self.status = status
+        self.status = intern(status)
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
 
 class DocumentVersion:
+    __slots__ = ("id", "document_id", "version_number", "file_path", "file_hash", "embedded", "created_at")
+
     def __init__(self, document_id, version_number, file_path, file_hash,
                  id=None, embedded=False, created_at=None):
         self.id = id or str(uuid4())
@@ -27,4 +55,7 @@ class DocumentVersion:
         self.file_path = file_path
         self.file_hash = file_hash
         self.embedded = embedded
-        self.created_at = created_at or datetime.utcnow()
+        self.created_at = parse_datetime(created_at) or datetime.utcnow()
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
@@ -1,19 +1,93 @@
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse
-from typing import Optional
-from services.chat_service import handle_chat_request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+import json
+from services.chat_service import (
+    handle_chat_request, stream_chat_request,
+    handle_batch_chat, iter_batch_chat, prepare_batch_documents,
+    BATCH_MAX_CONCURRENCY
+)
+from services import answer_cache
 
 router = APIRouter()
 
+# Answer engine for a request; unset means ANSWER_ENGINE
+EngineName = Literal["llm", "extractive", "auto"]
+
+class BatchChatRequest(BaseModel):
+    questions: List[str] = Field(..., min_length=1, max_length=1000)
+    doc_ids: List[str] = Field(..., min_length=1, max_length=100)
+    max_concurrency: int = Field(BATCH_MAX_CONCURRENCY, ge=1, le=64)
+    stream: bool = False
+    engine: Optional[EngineName] = None
+
 @router.post("/chat")
 async def chat(
     message: str = Form(...),
-    context_file: Optional[UploadFile] = File(default=None, description="Optional .txt or .pdf file")
+    context_file: Optional[UploadFile] = File(default=None, description="Optional .txt or .pdf file"),
+    engine: Optional[EngineName] = Form(default=None, description="llm, extractive or auto")
 ):
     try:
-        result = await handle_chat_request(context_file, message)
-        return JSONResponse(content={"response": result, "status": "success"})
+        result = await handle_chat_request(context_file, message, engine)
+        return JSONResponse(content={
+            "response": result["answer"],
+            "engine": result["engine"],
+            "citations": result["citations"],
+            "context_tokens": result["context_tokens"],
+            "cached": result["cached"],
+            "status": "success"
+        })
     except HTTPException as http_err:
         raise http_err
     except Exception as e:
         return JSONResponse(content={"error": str(e), "status": "error"}, status_code=500)
+
+
+@router.get("/chat/cache")
+def chat_cache_stats():
+    return answer_cache.get_stats()
+
+@router.post("/chat/stream")
+async def chat_stream(
+    message: str = Form(...),
+    context_file: Optional[UploadFile] = File(default=None, description="Optional .txt or .pdf file"),
+    engine: Optional[EngineName] = Form(default=None, description="llm, extractive or auto")
+):
+    # Server-Sent Events: a `context` event with the prompt size, one `data:` event
+    # per generated text delta, an `answer` event naming the engine with its citations,
+    # then `data: [DONE]`
+    context_tokens, deltas, result = await stream_chat_request(context_file, message, engine)
+
+    async def event_stream():
+        yield f"event: context\ndata: {json.dumps({'context_tokens': context_tokens})}\n\n"
+        try:
+            async for delta in deltas:
+                yield f"data: {json.dumps({'delta': delta})}\n\n"
+            answer = {"engine": result.get("engine"), "citations": result.get("citations", [])}
+            yield f"event: answer\ndata: {json.dumps(answer)}\n\n"
+            yield "data: [DONE]\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e), 'status': 'error'})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest):
+    # Answers many questions against the same existing documents; with `stream`
+    # the results come back as NDJSON lines in completion order
+    if not request.stream:
+        results = await handle_batch_chat(request.questions, request.doc_ids, request.max_concurrency, request.engine)
+        return {"results": results, "status": "success"}
+
+    await prepare_batch_documents(request.doc_ids)
+
+    async def result_stream():
+        async for result in iter_batch_chat(request.questions, request.doc_ids, request.max_concurrency, request.engine):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
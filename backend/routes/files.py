@@ -1,16 +1,19 @@
 # routes/files.py
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import FileResponse
-from models.document import Document, DocumentVersion
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from models.document import Document, format_datetime
 from services.file_service import (
-    documents_db, versions_db,
-    save_file_to_disk, calculate_file_hash,
-    save_db_to_disk
+    documents_db, versions_db, list_documents,
+    stage_upload, create_document, add_document_version,
+    remove_unreferenced_file, transaction, publish_change
 )
+from services import answer_cache, index_service, ingest_service, metrics, preview_service
 from datetime import datetime
+from typing import Optional
 from uuid import uuid4
 import os
+import mimetypes
 
 router = APIRouter()
 
@@ -24,31 +27,67 @@ async def upload_file(
     uploaded_by: str = Form("system")
 ):
     doc = Document(title, file.filename, tags.split(","), language, category, uploaded_by)
-    file_path = save_file_to_disk(file, doc.id)
-    file_hash = calculate_file_hash(file_path)
+    with metrics.timed("store_upload"):
+        staged_path, file_hash = await stage_upload(file, doc.id)
 
-    version = DocumentVersion(doc.id, version_number=1, file_path=file_path, file_hash=file_hash)
-    doc.versions.append(version.id)
+    # The store blocks while another worker holds its write lock, so it is kept off the event loop
+    with metrics.timed("db_write"):
+        version = await run_in_threadpool(create_document, doc, staged_path, file_hash)
 
-    documents_db[doc.id] = doc
-    versions_db[version.id] = version
+    # Extraction and indexing happen in the background ingest pool
+    ingest_service.queue_version(version.id)
 
-    save_db_to_disk()
+    return {
+        "document_id": doc.id,
+        "version_id": version.id,
+        "status": doc.status,
+        "message": "File uploaded and queued for processing."
+    }
 
-    return {"document_id": doc.id, "version_id": version.id, "message": "File uploaded and version created."}
+def to_stored_datetime(value: Optional[datetime]) -> Optional[str]:
+    # created_at is stored as fixed-width naive UTC text, which sorts lexicographically
+    return format_datetime(value) if value is not None else None
 
 @router.get("")
-def list_files():
-    return [{
-        "id": doc.id,
-        "title": doc.title,
-        "file_name": doc.file_name,
-        "language": doc.language,
-        "category": doc.category,
-        "tags": doc.tags,
-        "created_at": doc.created_at,
-        "status": doc.status
-    } for doc in documents_db.values()]
+def list_files(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    language: Optional[str] = None,
+    tags: Optional[str] = Query(None, description="Comma-separated; documents must have all of them"),
+    status: Optional[str] = None,
+    uploaded_by: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None
+):
+    try:
+        with metrics.timed("list_query"):
+            docs, next_cursor = list_documents(
+                limit=limit,
+                cursor=cursor,
+                tags=tags.split(",") if tags else None,
+                created_after=to_stored_datetime(created_after),
+                created_before=to_stored_datetime(created_before),
+                category=category,
+                language=language,
+                status=status,
+                uploaded_by=uploaded_by
+            )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {
+        "items": [{
+            "id": doc.id,
+            "title": doc.title,
+            "file_name": doc.file_name,
+            "language": doc.language,
+            "category": doc.category,
+            "tags": doc.tags,
+            "created_at": doc.created_at,
+            "status": doc.status
+        } for doc in docs],
+        "next_cursor": next_cursor
+    }
 
 @router.get("/{doc_id}")
 def get_file(doc_id: str):
@@ -68,33 +107,111 @@ def get_file(doc_id: str):
         "updated_at": doc.updated_at
     }
 
-@router.get("/{doc_id}/preview")
-def preview_file(doc_id: str):
+@router.get("/{doc_id}/status")
+def get_file_status(doc_id: str):
     if doc_id not in documents_db:
         raise HTTPException(status_code=404, detail="Document not found")
     doc = documents_db[doc_id]
-    if not doc.versions:
+    return {
+        "id": doc.id,
+        "status": doc.status,
+        "versions": [{
+            "id": vid,
+            "version_number": versions_db[vid].version_number,
+            "embedded": versions_db[vid].embedded
+        } for vid in doc.versions if vid in versions_db],
+        "updated_at": doc.updated_at
+    }
+
+def resolve_version(doc, version: str):
+    # `version` is "latest" or a version_number
+    versions = [versions_db[vid] for vid in doc.versions if vid in versions_db]
+    if not versions:
         raise HTTPException(status_code=400, detail="No versions found for document")
-    version = versions_db[doc.versions[0]]
-    if not os.path.exists(version.file_path):
+    if version == "latest":
+        return max(versions, key=lambda v: v.version_number)
+    for v in versions:
+        if str(v.version_number) == version:
+            return v
+    raise HTTPException(status_code=404, detail=f"Version {version} not found")
+
+@router.get("/{doc_id}/preview")
+def preview_file(
+    doc_id: str,
+    request: Request,
+    version: str = Query("latest", description='"latest" or a version number'),
+    mode: str = Query("file", pattern="^(file|text)$", description="file: raw bytes (Range/ETag aware); text: extracted text pages"),
+    page: int = Query(1, ge=1, description="First page for text previews (1-based)"),
+    pages: int = Query(1, ge=1, le=50, description="Number of pages for text previews")
+):
+    if doc_id not in documents_db:
+        raise HTTPException(status_code=404, detail="Document not found")
+    doc = documents_db[doc_id]
+    selected = resolve_version(doc, version)
+    if not os.path.exists(selected.file_path):
         raise HTTPException(status_code=404, detail="File not found on disk")
-    return FileResponse(version.file_path, media_type='application/octet-stream', filename=doc.file_name)
+    with metrics.timed("preview"):
+        if mode == "text":
+            return preview_service.text_preview(request, doc, selected, page, pages)
+        media_type = mimetypes.guess_type(doc.file_name)[0] or 'application/octet-stream'
+        return preview_service.file_response(request, selected.file_path, selected.file_hash, doc.file_name, media_type)
+
+@router.post("/{doc_id}/versions")
+async def add_version(doc_id: str, file: UploadFile = File(...)):
+    if await run_in_threadpool(documents_db.get, doc_id) is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    version_id = str(uuid4())
+    with metrics.timed("store_upload"):
+        staged_path, file_hash = await stage_upload(file, version_id)
+
+    with metrics.timed("db_write"):
+        doc, version, created = await run_in_threadpool(
+            add_document_version, doc_id, version_id, file.filename, staged_path, file_hash
+        )
+    if doc is None:
+        # Deleted while the file was being uploaded
+        raise HTTPException(status_code=404, detail="Document not found")
+    if not created:
+        return {
+            "document_id": doc_id,
+            "version_id": version.id,
+            "version_number": version.version_number,
+            "status": doc.status,
+            "message": "File is identical to the current version; no new version created."
+        }
+    answer_cache.invalidate_document(doc_id)
+
+    # Only pages that changed since the previous version are parsed; the index switches
+    # to the new version in one transaction once it is ready
+    ingest_service.queue_version(version.id)
+
+    return {
+        "document_id": doc_id,
+        "version_id": version.id,
+        "version_number": version.version_number,
+        "status": doc.status,
+        "message": "New version uploaded and queued for processing."
+    }
 
 @router.get("/{doc_id}/versions")
 def get_versions(doc_id: str):
     if doc_id not in documents_db:
         raise HTTPException(status_code=404, detail="Document not found")
     doc = documents_db[doc_id]
-    return [vars(versions_db[vid]) for vid in doc.versions]
+    return [versions_db[vid].to_dict() for vid in doc.versions if vid in versions_db]
 
 @router.delete("/{doc_id}")
 def delete_file(doc_id: str):
     if doc_id not in documents_db:
         raise HTTPException(status_code=404, detail="Document not found")
-    doc = documents_db.pop(doc_id)
-    for vid in doc.versions:
-        version = versions_db.pop(vid)
-        if os.path.exists(version.file_path):
-            os.remove(version.file_path)
-    save_db_to_disk()
+    with transaction():
+        doc = documents_db.pop(doc_id)
+        versions = [versions_db.pop(vid) for vid in doc.versions if vid in versions_db]
+        # Other workers drop their cached answers for this document when they see the change
+        publish_change("document_deleted", doc_id)
+        # Inside the transaction, so a concurrent upload cannot adopt a blob that is being removed
+        for version in versions:
+            remove_unreferenced_file(version.file_path, version.file_hash)
+    index_service.remove_document(doc_id)
+    answer_cache.invalidate_document(doc_id)
     return {"message": f"Document {doc_id} and its versions deleted."}
@@ -0,0 +1,22 @@
+# routes/health.py
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from services import lifecycle
+
+router = APIRouter()
+
+@router.get("")
+@router.get("/live")
+def liveness():
+    # The process is up and serving requests; says nothing about its dependencies
+    return {"status": "alive"}
+
+@router.get("/ready")
+def readiness():
+    # Ready once the metadata store is migrated and background services are running
+    if lifecycle.state["ready"]:
+        return {"status": "ready", "startup_s": lifecycle.state["startup_s"]}
+    if lifecycle.state["error"]:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": lifecycle.state["error"]})
+    return JSONResponse(status_code=503, content={"status": "starting"})
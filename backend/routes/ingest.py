@@ -0,0 +1,15 @@
+# routes/ingest.py
+
+from fastapi import APIRouter, BackgroundTasks
+from services import ingest_service
+
+router = APIRouter()
+
+@router.get("/status")
+def ingest_status():
+    return {"workers": ingest_service.INGEST_WORKERS, **ingest_service.progress}
+
+@router.post("/reindex")
+async def reindex(background_tasks: BackgroundTasks, only_missing: bool = False):
+    background_tasks.add_task(ingest_service.reindex_all, only_missing)
+    return {"message": "Re-indexing started.", "only_missing": only_missing}
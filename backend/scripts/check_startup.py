@@ -0,0 +1,63 @@
+# scripts/check_startup.py
+#
+# Startup regression check; exits 1 if any expectation fails.
+#   python -m scripts.check_startup
+#
+# 1. Importing the app does no I/O and does not load the heavy optional libraries.
+# 2. While the metadata store is busy (its write lock held, as by another worker migrating it),
+#    liveness answers, readiness and data routes answer 503, and the app becomes ready once
+#    the lock is released.
+
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY_MODULES = ("PyPDF2", "openai", "httpx", "tiktoken", "psycopg")
+READY_TIMEOUT = 10  # seconds
+
+failures = []
+
+def check(ok: bool, message: str):
+    print(f"{'ok  ' if ok else 'FAIL'} {message}")
+    if not ok:
+        failures.append(message)
+
+def main() -> int:
+    workdir = tempfile.mkdtemp(prefix="cms-startup-")
+    os.chdir(workdir)
+    sys.path.insert(0, BACKEND_DIR)
+
+    import main as app_module
+    loaded = [name for name in LAZY_MODULES if name in sys.modules]
+    check(not loaded, f"importing main loads none of {', '.join(LAZY_MODULES)} (loaded: {loaded or 'none'})")
+    check(not os.listdir(workdir), f"importing main creates no files (found: {os.listdir(workdir) or 'none'})")
+
+    # Imported only now: the test client itself pulls in httpx
+    from fastapi.testclient import TestClient
+
+    # Like a first worker mid-migration: the store is already in WAL mode and its write lock is held
+    lock = sqlite3.connect("cms_data.db", isolation_level=None)
+    lock.execute("PRAGMA journal_mode=WAL")
+    lock.execute("BEGIN IMMEDIATE")
+    with TestClient(app_module.app) as client:
+        check(client.get("/api/health/live").status_code == 200, "liveness answers while the store is locked")
+        ready = client.get("/api/health/ready")
+        check(ready.status_code == 503 and ready.json()["status"] == "starting", "readiness is 503 starting before the store is ready")
+        check(client.get("/api/files").status_code == 503, "data routes answer 503 before the store is ready")
+        lock.execute("ROLLBACK")
+        lock.close()
+
+        deadline = time.monotonic() + READY_TIMEOUT
+        while client.get("/api/health/ready").status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        check(client.get("/api/health/ready").status_code == 200, f"ready within {READY_TIMEOUT}s of the store being released")
+        check(client.get("/api/files").status_code == 200, "data routes answer once ready")
+
+    print(f"{len(failures)} failed" if failures else "all checks passed")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+# scripts/stub_llm_server.py
+#
+# Minimal OpenAI-compatible chat completions server for local testing and benchmarks.
+#   uvicorn scripts.stub_llm_server:app --port 9000
+#   OPENAI_ENDPOINT=http://127.0.0.1:9000 uvicorn main:app
+
+import os
+import json
+import time
+import asyncio
+from uuid import uuid4
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+STUB_LLM_DELAY = float(os.getenv("STUB_LLM_DELAY", "0"))              # seconds before the first token
+STUB_LLM_TOKEN_DELAY = float(os.getenv("STUB_LLM_TOKEN_DELAY", "0"))  # seconds between streamed tokens
+
+app = FastAPI(title="Stub LLM")
+
+def make_answer(messages: list) -> str:
+    # Deterministic: repeat the question found at the end of the prompt
+    prompt = messages[-1]["content"] if messages else ""
+    question = prompt.rsplit("question:", 1)[-1].strip()
+    return f"Stub answer to: {question}"
+
+def completion_chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+    chunk = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+@app.post("/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "stub")
+    answer = make_answer(body.get("messages", []))
+    completion_id = f"chatcmpl-{uuid4().hex}"
+    await asyncio.sleep(STUB_LLM_DELAY)
+
+    if body.get("stream"):
+        async def events():
+            yield completion_chunk(completion_id, model, {"role": "assistant", "content": ""})
+            for word in answer.split(" "):
+                await asyncio.sleep(STUB_LLM_TOKEN_DELAY)
+                yield completion_chunk(completion_id, model, {"content": word + " "})
+            yield completion_chunk(completion_id, model, {}, finish_reason="stop")
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    prompt_tokens = sum(len(m.get("content", "").split()) for m in body.get("messages", []))
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": answer},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(answer.split()),
+            "total_tokens": prompt_tokens + len(answer.split())
+        }
+    }
@@ -0,0 +1,124 @@
+# services/answer_cache.py
+
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))          # entries, LRU beyond this
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))          # seconds
+# Jaccard similarity over question words for a near-match hit; 0 disables near matches
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0"))
+
+class CacheEntry:
+    def __init__(self, answer, words, document_ids):
+        self.answer = answer
+        self.words = words
+        self.document_ids = set(document_ids)
+        self.created_at = time.monotonic()
+
+_lock = threading.Lock()
+_entries = OrderedDict()   # (question, context_key) -> CacheEntry, least recently used first
+_by_context = {}           # context_key -> set of questions, for near-match lookups
+_by_document = {}          # document_id -> set of entry keys, for invalidation
+stats = {"hits": 0, "near_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+def normalize_question(question: str) -> str:
+    return " ".join(re.findall(r"\w+", question.lower()))
+
+def make_context_key(context_hashes) -> frozenset:
+    return frozenset(context_hashes)
+
+def similarity(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def _remove(key):
+    entry = _entries.pop(key, None)
+    if entry is None:
+        return
+    question, context_key = key
+    questions = _by_context.get(context_key)
+    if questions is not None:
+        questions.discard(question)
+        if not questions:
+            del _by_context[context_key]
+    for document_id in entry.document_ids:
+        keys = _by_document.get(document_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del _by_document[document_id]
+
+def _live(key):
+    entry = _entries.get(key)
+    if entry is None:
+        return None
+    if time.monotonic() - entry.created_at > ANSWER_CACHE_TTL:
+        _remove(key)
+        return None
+    _entries.move_to_end(key)
+    return entry
+
+def get(question: str, context_hashes) -> str:
+    question = normalize_question(question)
+    context_key = make_context_key(context_hashes)
+    with _lock:
+        entry = _live((question, context_key))
+        if entry is not None:
+            stats["hits"] += 1
+            return entry.answer
+
+        if ANSWER_CACHE_SIMILARITY > 0:
+            # Near matches are only considered against exactly the same context
+            words = set(question.split())
+            best, best_score = None, ANSWER_CACHE_SIMILARITY
+            for candidate in list(_by_context.get(context_key, ())):
+                entry = _live((candidate, context_key))
+                if entry is not None:
+                    score = similarity(words, entry.words)
+                    if score >= best_score:
+                        best, best_score = entry, score
+            if best is not None:
+                stats["near_hits"] += 1
+                return best.answer
+
+        stats["misses"] += 1
+        return None
+
+def put(question: str, context_hashes, answer: str, document_ids=()):
+    question = normalize_question(question)
+    context_key = make_context_key(context_hashes)
+    key = (question, context_key)
+    with _lock:
+        _remove(key)
+        _entries[key] = CacheEntry(answer, set(question.split()), document_ids)
+        _by_context.setdefault(context_key, set()).add(question)
+        for document_id in document_ids:
+            _by_document.setdefault(document_id, set()).add(key)
+        while len(_entries) > ANSWER_CACHE_SIZE:
+            _remove(next(iter(_entries)))
+            stats["evictions"] += 1
+
+def invalidate_document(document_id: str) -> int:
+    # Called when a document is deleted or gets a new version
+    with _lock:
+        keys = list(_by_document.get(document_id, ()))
+        for key in keys:
+            _remove(key)
+        stats["invalidations"] += len(keys)
+        return len(keys)
+
+def clear():
+    with _lock:
+        _entries.clear()
+        _by_context.clear()
+        _by_document.clear()
+
+def get_stats() -> dict:
+    with _lock:
+        lookups = stats["hits"] + stats["near_hits"] + stats["misses"]
+        hit_rate = (stats["hits"] + stats["near_hits"]) / lookups if lookups else 0.0
+        return {**stats, "entries": len(_entries), "hit_rate": round(hit_rate, 4)}
@@ -0,0 +1,207 @@
+# services/answer_engine.py
+#
+# Answer engines turn a question plus its retrieved context into an answer.
+#   llm         the chat completion endpoint (llm_client)
+#   extractive  local and CPU only: ranks the context's sentences against the question and
+#               returns the best span with citations; deterministic, no network
+#   auto        simple lookups are answered extractively, everything else goes to the LLM,
+#               with the extractive answer as fallback when the LLM fails or is too slow
+# ANSWER_ENGINE sets the default; chat requests can pick one with `engine`.
+
+import os
+import re
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from fastapi import HTTPException
+from services import llm_client, metrics
+from services.context_builder import rank_chunks
+from services.index_service import query_terms
+
+ANSWER_ENGINE = os.getenv("ANSWER_ENGINE", "llm")
+LLM_FALLBACK_TIMEOUT = float(os.getenv("LLM_FALLBACK_TIMEOUT", "15"))           # seconds "auto" waits for the LLM
+EXTRACTIVE_MAX_SENTENCES = int(os.getenv("EXTRACTIVE_MAX_SENTENCES", "3"))     # longest answer span
+AUTO_LOOKUP_CONFIDENCE = float(os.getenv("AUTO_LOOKUP_CONFIDENCE", "0.8"))     # share of question terms the span must cover
+AUTO_LOOKUP_MAX_WORDS = 12
+
+NOT_FOUND = "Information not available in the provided document."
+
+# A sentence ends at . ! or ? followed by whitespace, at a blank line, or at the end of the text.
+# Single line breaks are kept inside the sentence: extracted PDF text wraps mid-sentence.
+SENTENCE_RE = re.compile(r"\S.*?(?:[.!?]+(?=\s|$)|(?=\n\s*\n)|$)", re.DOTALL)
+LOOKUP_RE = re.compile(r"^\s*(who|whom|whose|what|when|where|which|how (many|much|long|old|far|big))\b", re.IGNORECASE)
+
+logger = logging.getLogger(__name__)
+
+def context_passages(context: dict, document_id: str = None) -> list:
+    # Passages the context was packed from; a small document sent whole is one passage
+    passages = [
+        {"document_id": chunk.get("document_id", document_id), "chunk_no": chunk.get("chunk_no"), "text": chunk["text"]}
+        for chunk in context.get("chunks", [])
+    ]
+    if not passages and context["text"].strip():
+        passages = [{"document_id": document_id, "chunk_no": None, "text": context["text"]}]
+    return passages
+
+def words(text: str) -> set:
+    return set(re.findall(r"\w+", text.lower()))
+
+def extract_answer(question: str, passages: list) -> dict:
+    # Best-matching span of up to EXTRACTIVE_MAX_SENTENCES consecutive sentences of one passage.
+    # `confidence` is the share of the question's terms that the span contains.
+    sentences = [
+        (i, match.start(), match.end())
+        for i, passage in enumerate(passages)
+        for match in SENTENCE_RE.finditer(passage["text"])
+    ]
+    texts = [passages[i]["text"][start:end] for i, start, end in sentences]
+    ranked = rank_chunks(texts, question)
+    if not ranked or ranked[0]["score"] <= 0:
+        return {"answer": NOT_FOUND, "confidence": 0.0, "citations": []}
+
+    # "How many", "how long", ... are part of the question, not terms the answer repeats
+    terms = set(query_terms(LOOKUP_RE.sub("", question))) or set(query_terms(question))
+    best = ranked[0]["chunk_no"]
+    passage_no = sentences[best][0]
+    first = last = best
+    covered = words(texts[best]) & terms
+    # Grow the span towards whichever neighbour in the same passage adds question terms
+    while last - first + 1 < EXTRACTIVE_MAX_SENTENCES:
+        gain, neighbour = max(
+            ((len((words(texts[j]) & terms) - covered), j)
+             for j in (first - 1, last + 1)
+             if 0 <= j < len(sentences) and sentences[j][0] == passage_no),
+            default=(0, None)
+        )
+        if not gain:
+            break
+        covered |= words(texts[neighbour])
+        first, last = min(first, neighbour), max(last, neighbour)
+
+    passage = passages[passage_no]
+    start, end = sentences[first][1], sentences[last][2]
+    return {
+        "answer": " ".join(passage["text"][start:end].split()),
+        "confidence": round(len(covered & terms) / len(terms), 3) if terms else 0.0,
+        "citations": [{
+            "document_id": passage["document_id"],
+            "chunk_no": passage["chunk_no"],
+            "start": start,
+            "end": end,
+            "score": round(ranked[0]["score"], 4)
+        }]
+    }
+
+def is_simple_lookup(question: str, extracted: dict) -> bool:
+    # Short who/what/when/... questions whose terms all (or nearly all) appear in one span
+    return (
+        len(question.split()) <= AUTO_LOOKUP_MAX_WORDS
+        and LOOKUP_RE.match(question) is not None
+        and extracted["confidence"] >= AUTO_LOOKUP_CONFIDENCE
+    )
+
+def build_chat_messages(document_context: str, user_input: str) -> list:
+    prompt = (
+        f"You are an assistant that answers questions based on the following document content or general knowledge:\n\n"
+        f"{document_context}\n\n"
+        f"If the answer is not found in the document, respond with 'Information not available in the provided document.'\n"
+        f"Now, answer the following question: {user_input}"
+    )
+
+    return [
+        {"role": "system", "content": "You are a helpful assistant that answers based on the given context."},
+        {"role": "user", "content": prompt}
+    ]
+
+class AnswerEngine(ABC):
+    # `context` is the dict built by chat_service: text, tokens, hashes, document_ids, passages.
+    # Results are {"answer", "engine", "citations", "reason"}; `engine` is the one that actually
+    # answered and `reason` why (requested, lookup, fallback).
+    name = None
+
+    @abstractmethod
+    async def answer(self, question: str, context: dict) -> dict:
+        ...
+
+    async def stream(self, question: str, context: dict, result: dict):
+        # Yields the answer text; `result` is filled in as the answer is produced
+        answer = await self.answer(question, context)
+        result.update(answer)
+        yield answer["answer"]
+
+class LLMEngine(AnswerEngine):
+    name = "llm"
+
+    async def answer(self, question: str, context: dict) -> dict:
+        with metrics.timed("llm"):
+            answer = await llm_client.complete(build_chat_messages(context["text"], question))
+        return {"answer": answer, "engine": self.name, "citations": [], "reason": "requested"}
+
+    async def stream(self, question: str, context: dict, result: dict):
+        result.update(engine=self.name, citations=[], reason="requested")
+        parts = []
+        async for delta in llm_client.stream(build_chat_messages(context["text"], question)):
+            parts.append(delta)
+            yield delta
+        result["answer"] = "".join(parts)
+
+class ExtractiveEngine(AnswerEngine):
+    name = "extractive"
+
+    async def answer(self, question: str, context: dict) -> dict:
+        with metrics.timed("extractive"):
+            extracted = extract_answer(question, context["passages"])
+        return {**extracted, "engine": self.name, "reason": "requested"}
+
+class AutoEngine(AnswerEngine):
+    name = "auto"
+
+    def __init__(self, llm: AnswerEngine, extractive: AnswerEngine):
+        self.llm = llm
+        self.extractive = extractive
+
+    async def answer(self, question: str, context: dict) -> dict:
+        extracted = await self.extractive.answer(question, context)
+        if is_simple_lookup(question, extracted):
+            return {**extracted, "reason": "lookup"}
+        try:
+            return await asyncio.wait_for(self.llm.answer(question, context), LLM_FALLBACK_TIMEOUT)
+        except llm_client.errors() as e:
+            logger.warning("LLM answer failed (%s), falling back to the extractive answer", repr(e))
+            return {**extracted, "reason": "fallback"}
+
+    async def stream(self, question: str, context: dict, result: dict):
+        extracted = await self.extractive.answer(question, context)
+        if is_simple_lookup(question, extracted):
+            result.update(extracted, reason="lookup")
+            yield extracted["answer"]
+            return
+        deltas = self.llm.stream(question, context, result)
+        try:
+            # Only the wait for the first piece is bounded; once text has been sent there is no going back
+            first = await asyncio.wait_for(deltas.__anext__(), LLM_FALLBACK_TIMEOUT)
+        except StopAsyncIteration:
+            first = ""
+        except llm_client.errors() as e:
+            await deltas.aclose()
+            logger.warning("LLM stream failed (%s), falling back to the extractive answer", repr(e))
+            result.clear()
+            result.update(extracted, reason="fallback")
+            yield extracted["answer"]
+            return
+        yield first
+        async for delta in deltas:
+            yield delta
+
+_llm = LLMEngine()
+_extractive = ExtractiveEngine()
+ENGINES = {engine.name: engine for engine in (_llm, _extractive, AutoEngine(_llm, _extractive))}
+
+if ANSWER_ENGINE not in ENGINES:
+    raise RuntimeError(f"Unsupported ANSWER_ENGINE: {ANSWER_ENGINE} (expected one of {', '.join(ENGINES)})")
+
+def get_engine(name: str = None) -> AnswerEngine:
+    engine = ENGINES.get(name or ANSWER_ENGINE)
+    if engine is None:
+        raise HTTPException(status_code=400, detail=f"Unknown answer engine '{name}' (expected one of {', '.join(ENGINES)})")
+    return engine
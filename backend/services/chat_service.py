@@ -1,49 +1,35 @@
 # services/chat_service.py
 
 import os
-import PyPDF2
-from io import BytesIO
+import time
+import asyncio
 from fastapi import UploadFile, HTTPException
-from openai import OpenAI
-from typing import Optional, Union
-from uuid import uuid4
+from typing import Optional
 from services.file_service import (
-    save_file_to_disk,
-    calculate_file_hash,
-    save_db_to_disk,
-    documents_db,
-    versions_db,
-    Document,
-    DocumentVersion
+    latest_version,
+    stage_upload,
+    create_document,
+    Document
+)
+from services import (
+    answer_cache, answer_engine, context_builder, index_service, ingest_service, llm_client, metrics, text_service
 )
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "sk-3fv-EeXCjYP3xeigsr9O3w")
-OPENAI_ENDPOINT = "https://aiportalapi.stu-platform.live/jpe"
-MODEL_NAME = "GPT-4.1"
-
-UPLOAD_FOLDER = "uploaded_files"
-
-client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_ENDPOINT)
+# Chunks fetched from the index before packing them into the token budget
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "32"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))   # LLM calls in flight per batch
 
-def extract_text_from_file_path(file_path: str) -> str:
-    text = ""
-    try:
-        if file_path.lower().endswith(".txt"):
-            with open(file_path, "r", encoding="utf-8") as f:
-                text += f.read()
-        elif file_path.lower().endswith(".pdf"):
-            with open(file_path, "rb") as f:
-                pdf_reader = PyPDF2.PdfReader(f)
-                for page in pdf_reader.pages:
-                    extracted_text = page.extract_text()
-                    if extracted_text:
-                        text += extracted_text + "\n"
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to read fallback file: {str(e)}")
-    return text
+def build_file_context(file_path: str, file_hash: str, user_input: str) -> dict:
+    # Cache read, boilerplate removal and ranking are CPU/disk work; callers run this in a thread
+    return context_builder.build_context_from_pages(text_service.get_pages(file_path, file_hash), user_input)
 
-async def handle_chat_request(file: Optional[UploadFile], user_input: str) -> str:
+async def build_chat_context(file: Optional[UploadFile], user_input: str) -> dict:
+    # Returns the context text plus the content hashes and documents it was built from
     DOCUMENT_CONTEXT = ""
+    context_tokens = 0
+    context_hashes = []
+    document_ids = []
+    passages = []
 
     if file and hasattr(file, 'filename') and file.filename:
         if not file.filename.lower().endswith((".txt", ".pdf")):
@@ -59,40 +45,43 @@ async def handle_chat_request(file: Optional[UploadFile], user_input: str) -> st
                 category="chat",
                 uploaded_by="chat-service"
             )
-            file_path = save_file_to_disk(file, doc.id)
-            file_hash = calculate_file_hash(file_path)
-
-            version = DocumentVersion(doc.id, version_number=1, file_path=file_path, file_hash=file_hash)
-            doc.versions.append(version.id)
-            documents_db[doc.id] = doc
-            versions_db[version.id] = version
-            save_db_to_disk()
-
-            file.file.seek(0)
-            if file.filename.lower().endswith(".txt"):
-                DOCUMENT_CONTEXT = (await file.read()).decode("utf-8")
-            elif file.filename.lower().endswith(".pdf"):
-                pdf_reader = PyPDF2.PdfReader(BytesIO(await file.read()))
-                for page in pdf_reader.pages:
-                    extracted_text = page.extract_text()
-                    if extracted_text:
-                        DOCUMENT_CONTEXT += extracted_text + "\n"
+            with metrics.timed("store_upload"):
+                staged_path, file_hash = await stage_upload(file, doc.id)
+            with metrics.timed("db_write"):
+                version = await asyncio.to_thread(create_document, doc, staged_path, file_hash)
+            file_path = version.file_path
+
+            # Extraction runs in the ingest process pool and fills the text cache
+            if not await ingest_service.wait_for_version(version.id):
+                raise HTTPException(status_code=400, detail="Uploaded file could not be processed")
+            with metrics.timed("context_build"):
+                context = await asyncio.to_thread(build_file_context, file_path, file_hash, user_input)
+            DOCUMENT_CONTEXT = context["text"]
+            context_tokens = context["tokens"]
+            context_hashes = [file_hash]
+            document_ids = [doc.id]
+            passages = answer_engine.context_passages(context, doc.id)
 
             if not DOCUMENT_CONTEXT.strip():
                 raise HTTPException(status_code=400, detail="Uploaded file is empty or no text could be extracted")
 
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to read uploaded file: {str(e)}")
 
     elif not file and user_input:
-        # Fallback: Read from uploaded_files folder
-        if not os.path.exists(UPLOAD_FOLDER):
-            DOCUMENT_CONTEXT = "The user did not upload a file, and no fallback documents are available."
-        else:
-            for filename in os.listdir(UPLOAD_FOLDER):
-                filepath = os.path.join(UPLOAD_FOLDER, filename)
-                if filename.lower().endswith((".txt", ".pdf")):
-                    DOCUMENT_CONTEXT += extract_text_from_file_path(filepath)
+        # Fallback: retrieve the most relevant chunks from the indexed corpus
+        with metrics.timed("retrieval"):
+            candidates = await asyncio.to_thread(index_service.search, user_input, top_k=RETRIEVAL_CANDIDATES)
+        with metrics.timed("context_build"):
+            context = await asyncio.to_thread(context_builder.pack_chunks, candidates)
+        chunks = context["chunks"]
+        DOCUMENT_CONTEXT = context["text"]
+        context_tokens = context["tokens"]
+        context_hashes = [chunk["hash"] for chunk in chunks]
+        document_ids = list({chunk["document_id"] for chunk in chunks})
+        passages = answer_engine.context_passages(context)
 
         if not DOCUMENT_CONTEXT.strip():
             DOCUMENT_CONTEXT = ""
@@ -100,24 +89,157 @@ async def handle_chat_request(file: Optional[UploadFile], user_input: str) -> st
     else:
         DOCUMENT_CONTEXT = ""
 
-    prompt = (
-        f"You are an assistant that answers questions based on the following document content or general knowledge:\n\n"
-        f"{DOCUMENT_CONTEXT}\n\n"
-        f"If the answer is not found in the document, respond with 'Information not available in the provided document.'\n"
-        f"Now, answer the following question: {user_input}"
-    )
+    metrics.prompt_tokens.observe(context_tokens)
+    return {
+        "text": DOCUMENT_CONTEXT,
+        "tokens": context_tokens,
+        "hashes": context_hashes,
+        "document_ids": document_ids,
+        "passages": passages
+    }
+
+async def answer_with_context(user_input: str, context: dict, engine: answer_engine.AnswerEngine) -> dict:
+    # Only LLM answers are cached; the extractive engine is cheaper than a cache lookup
+    if engine.name != "extractive":
+        with metrics.timed("cache_lookup"):
+            cached = answer_cache.get(user_input, context["hashes"])
+        if cached is not None:
+            return {"answer": cached, "engine": "llm", "citations": [], "context_tokens": context["tokens"], "cached": True}
 
     try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that answers based on the given context."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=500,
-            temperature=0.7
+        result = await engine.answer(user_input, context)
+    except llm_client.errors() as e:
+        # Only LLM failures are reported as such; anything else keeps its own message
+        raise HTTPException(status_code=500, detail=f"OpenAI API call failed: {str(e)}")
+    metrics.answers.inc(engine=result["engine"], reason=result["reason"])
+    if result["engine"] == "llm":
+        answer_cache.put(user_input, context["hashes"], result["answer"], context["document_ids"])
+    return {
+        "answer": result["answer"],
+        "engine": result["engine"],
+        "citations": result["citations"],
+        "context_tokens": context["tokens"],
+        "cached": False
+    }
+
+async def handle_chat_request(file: Optional[UploadFile], user_input: str, engine: Optional[str] = None) -> dict:
+    engine = answer_engine.get_engine(engine)
+    context = await build_chat_context(file, user_input)
+    return await answer_with_context(user_input, context, engine)
+
+def find_batch_versions(doc_ids: list) -> tuple:
+    # Returns (missing document ids, {document id: latest version id} for those not yet indexed);
+    # only the latest version of a document is searchable
+    missing, pending = [], {}
+    for doc_id in doc_ids:
+        version = latest_version(doc_id)
+        if version is None:
+            missing.append(doc_id)
+        elif not version.embedded:
+            pending[doc_id] = version.id
+    return missing, pending
+
+async def prepare_batch_documents(doc_ids: list):
+    # Every document is resolved and indexed once for the whole batch; versions the background
+    # queue is already processing are waited for rather than extracted again
+    missing, pending = await asyncio.to_thread(find_batch_versions, doc_ids)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Documents not found: {', '.join(missing)}")
+    results = await asyncio.gather(*(ingest_service.wait_for_version(vid) for vid in pending.values()))
+    failed = [doc_id for doc_id, ok in zip(pending, results) if not ok]
+    if failed:
+        raise HTTPException(status_code=400, detail=f"Documents could not be processed: {', '.join(failed)}")
+
+def retrieve_context(user_input: str, doc_ids: list) -> dict:
+    with metrics.timed("retrieval"):
+        candidates = index_service.search(user_input, top_k=RETRIEVAL_CANDIDATES, document_ids=doc_ids)
+    context = context_builder.pack_chunks(candidates)
+    metrics.prompt_tokens.observe(context["tokens"])
+    return {
+        "text": context["text"],
+        "tokens": context["tokens"],
+        "hashes": [chunk["hash"] for chunk in context["chunks"]],
+        "document_ids": list({chunk["document_id"] for chunk in context["chunks"]}),
+        "passages": answer_engine.context_passages(context)
+    }
+
+async def answer_batch_question(index: int, question: str, doc_ids: list, semaphore: asyncio.Semaphore,
+                                engine: answer_engine.AnswerEngine) -> dict:
+    started = retrieved = time.perf_counter()
+    result = {"index": index, "question": question}
+    try:
+        context = await asyncio.to_thread(retrieve_context, question, doc_ids)
+        retrieved = time.perf_counter()
+        async with semaphore:
+            answer = await answer_with_context(question, context, engine)
+        result.update(
+            response=answer["answer"],
+            engine=answer["engine"],
+            citations=answer["citations"],
+            context_tokens=answer["context_tokens"],
+            cached=answer["cached"],
+            status="success"
         )
-        return response.choices[0].message.content
-
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"OpenAI API call failed: {str(e)}")
\ No newline at end of file
+        result.update(error=getattr(e, "detail", str(e)), status="error")
+    finished = time.perf_counter()
+    result["timings"] = {
+        "retrieval_ms": round((retrieved - started) * 1000, 2),
+        "answer_ms": round((finished - retrieved) * 1000, 2),
+        "total_ms": round((finished - started) * 1000, 2)
+    }
+    return result
+
+async def iter_batch_chat(questions: list, doc_ids: list, max_concurrency: int = BATCH_MAX_CONCURRENCY,
+                         engine: Optional[str] = None):
+    # Yields per-question results as they finish; call prepare_batch_documents first
+    engine = answer_engine.get_engine(engine)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    # Repeated questions in one batch share a single retrieval + LLM call
+    groups = {}
+    for i, question in enumerate(questions):
+        groups.setdefault(answer_cache.normalize_question(question), []).append(i)
+    tasks = [
+        asyncio.create_task(answer_batch_question(indexes[0], questions[indexes[0]], doc_ids, semaphore, engine))
+        for indexes in groups.values()
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            for i in groups[answer_cache.normalize_question(result["question"])]:
+                yield {**result, "index": i, "question": questions[i]}
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def handle_batch_chat(questions: list, doc_ids: list, max_concurrency: int = BATCH_MAX_CONCURRENCY,
+                            engine: Optional[str] = None) -> list:
+    await prepare_batch_documents(doc_ids)
+    results = [result async for result in iter_batch_chat(questions, doc_ids, max_concurrency, engine)]
+    return sorted(results, key=lambda r: r["index"])
+
+async def stream_cached(answer: str):
+    yield answer
+
+async def stream_answer(engine: answer_engine.AnswerEngine, user_input: str, context: dict, result: dict):
+    parts = []
+    async for delta in engine.stream(user_input, context, result):
+        parts.append(delta)
+        yield delta
+    metrics.answers.inc(engine=result["engine"], reason=result["reason"])
+    if result["engine"] == "llm":
+        answer_cache.put(user_input, context["hashes"], "".join(parts), context["document_ids"])
+
+async def stream_chat_request(file: Optional[UploadFile], user_input: str, engine: Optional[str] = None) -> tuple:
+    # Context is prepared before the response starts, so file errors still surface as HTTP errors.
+    # Returns (context_tokens, async iterator of answer text, result); `result` holds the
+    # answering engine and its citations once the iterator is exhausted.
+    engine = answer_engine.get_engine(engine)
+    context = await build_chat_context(file, user_input)
+    if engine.name != "extractive":
+        with metrics.timed("cache_lookup"):
+            cached = answer_cache.get(user_input, context["hashes"])
+        if cached is not None:
+            return context["tokens"], stream_cached(cached), {"engine": "llm", "citations": []}
+    result = {}
+    return context["tokens"], stream_answer(engine, user_input, context, result), result
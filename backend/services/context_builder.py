@@ -0,0 +1,136 @@
+# services/context_builder.py
+
+import os
+import re
+import math
+import hashlib
+import threading
+from collections import Counter
+from services.index_service import chunk_text, query_terms
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# A line near the top/bottom of a page that repeats on at least this share of pages
+# is treated as a header/footer
+BOILERPLATE_PAGE_RATIO = 0.5
+BOILERPLATE_EDGE_LINES = 3
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+PAGE_NUMBER_RE = re.compile(r"^\s*(page\s*)?\d+(\s*(of|/)\s*\d+)?\s*$", re.IGNORECASE)
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+def get_encoding():
+    # Loaded on first use, not at import: get_encoding() may download the BPE file
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception:  # optional dependency, or encoding files not available offline
+                    _encoding = None
+                _encoding_loaded = True
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # Local approximation of BPE: long words split into ~4 character pieces
+    return sum(math.ceil(len(t) / 4) if t[0].isalnum() else 1 for t in TOKEN_RE.findall(text))
+
+def line_signature(line: str) -> str:
+    # Digits in short lines are masked so "Page 3 of 10" and "Page 4 of 10" match
+    line = line.strip().lower()
+    return re.sub(r"\d+", "#", line) if len(line.split()) <= 6 else line
+
+def edge_lines(lines: list) -> list:
+    lines = [line for line in lines if line.strip()]
+    return lines[:BOILERPLATE_EDGE_LINES] + lines[-BOILERPLATE_EDGE_LINES:]
+
+def strip_boilerplate(pages: list) -> list:
+    pages_lines = [page.splitlines() for page in pages]
+    repeated = set()
+    if len(pages) >= 3:
+        counts = Counter(sig for lines in pages_lines for sig in {line_signature(l) for l in edge_lines(lines)})
+        threshold = max(2, math.ceil(len(pages) * BOILERPLATE_PAGE_RATIO))
+        repeated = {sig for sig, count in counts.items() if count >= threshold}
+    cleaned = []
+    for lines in pages_lines:
+        edges = set(edge_lines(lines))
+        # A bare number is a page number only as the first or last line of a page in a
+        # multi-page document; anywhere else it is content (e.g. a table cell)
+        body = [line for line in lines if line.strip()]
+        numbered = {0, len(body) - 1} if len(pages) > 1 else set()
+        cleaned.append("\n".join(
+            line for i, line in enumerate(body)
+            if not (i in numbered and PAGE_NUMBER_RE.match(line))
+            and not (line in edges and not line.strip().isdigit() and line_signature(line) in repeated)
+        ))
+    return cleaned
+
+def rank_chunks(chunks: list, query: str) -> list:
+    # BM25 over the chunks of a single document, for files that are not looked up in the index
+    terms = set(query_terms(query))
+    docs = [Counter(re.findall(r"\w+", chunk.lower())) for chunk in chunks]
+    avg_len = sum(sum(d.values()) for d in docs) / len(docs) if docs else 0
+    df = {t: sum(1 for d in docs if t in d) for t in terms}
+    scored = []
+    for i, (chunk, d) in enumerate(zip(chunks, docs)):
+        length = sum(d.values()) or 1
+        score = 0.0
+        for t in terms:
+            if d[t]:
+                idf = math.log(1 + (len(docs) - df[t] + 0.5) / (df[t] + 0.5))
+                score += idf * d[t] * 2.2 / (d[t] + 1.2 * (0.25 + 0.75 * length / (avg_len or 1)))
+        scored.append({"text": chunk, "hash": hashlib.sha256(chunk.encode("utf-8")).hexdigest(), "chunk_no": i, "score": score})
+    return sorted(scored, key=lambda c: -c["score"])
+
+def truncate_to_budget(text: str, budget: int) -> str:
+    encoding = get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:budget])
+    words = text.split(" ")
+    kept, used = [], 0
+    for word in words:
+        used += count_tokens(word) + 1
+        if used > budget:
+            break
+        kept.append(word)
+    return " ".join(kept)
+
+def pack_chunks(chunks: list, budget: int = CONTEXT_TOKEN_BUDGET) -> dict:
+    # Greedy by relevance: skip duplicates and anything that no longer fits
+    seen, used, tokens = set(), [], 0
+    for chunk in chunks:
+        text = chunk["text"].strip()
+        key = chunk.get("hash") or text
+        if not text or key in seen:
+            continue
+        seen.add(key)
+        cost = count_tokens(text)
+        if tokens + cost > budget:
+            if used:
+                continue
+            # Even the best chunk is too large: keep as much of it as fits
+            text = truncate_to_budget(text, budget)
+            cost = count_tokens(text)
+        used.append({**chunk, "text": text})
+        tokens += cost
+    return {
+        "text": "\n\n".join(chunk["text"] for chunk in used),
+        "tokens": tokens,
+        "chunks": used
+    }
+
+def build_context_from_pages(pages: list, query: str, budget: int = CONTEXT_TOKEN_BUDGET) -> dict:
+    pages = strip_boilerplate(pages)
+    text = "\n".join(page for page in pages if page)
+    tokens = count_tokens(text)
+    if tokens <= budget:
+        # Small documents are sent whole, in reading order
+        return {"text": text, "tokens": tokens, "chunks": []}
+    return pack_chunks(rank_chunks(chunk_text(text), query), budget)
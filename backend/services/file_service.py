@@ -2,47 +2,439 @@
 
 import os
 import json
+import base64
 import hashlib
-import shutil
+from datetime import datetime
+from collections.abc import MutableMapping
 from fastapi import UploadFile
-from models.document import Document, DocumentVersion
+from fastapi.concurrency import run_in_threadpool
+from models.document import Document, DocumentVersion, format_datetime
+from services import storage
+from services.storage import get_connection, transaction, publish_change
 
 UPLOAD_DIR = "./uploaded_files"
-DB_CACHE_FILE = "./cms_data.json"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+DB_CACHE_FILE = "./cms_data.json"  # legacy whole-file store, imported once into DB_FILE
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
-documents_db = {}
-versions_db = {}
+# Metadata schema, shared by both storage backends
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    file_name TEXT,
+    tags TEXT,
+    language TEXT,
+    category TEXT,
+    uploaded_by TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    versions TEXT,
+    status TEXT
+);
+CREATE TABLE IF NOT EXISTS versions (
+    id TEXT PRIMARY KEY,
+    document_id TEXT NOT NULL,
+    version_number INTEGER,
+    file_path TEXT,
+    file_hash TEXT,
+    embedded INTEGER,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_versions_document ON versions(document_id);
+CREATE INDEX IF NOT EXISTS idx_versions_hash ON versions(file_hash);
+CREATE INDEX IF NOT EXISTS idx_versions_embedded ON versions(embedded);
 
-def save_file_to_disk(upload_file: UploadFile, doc_id: str) -> str:
-    file_path = os.path.join(UPLOAD_DIR, f"{doc_id}_{upload_file.filename}")
+-- Secondary indexes for the filtered, newest-first listing
+CREATE INDEX IF NOT EXISTS idx_documents_created ON documents(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_documents_category ON documents(category, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_documents_language ON documents(language, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_documents_status ON documents(status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_documents_uploaded_by ON documents(uploaded_by, created_at, id);
+
+-- One row per (document, tag), kept in sync with documents.tags by triggers
+CREATE TABLE IF NOT EXISTS document_tags (
+    document_id TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_document_tags_tag ON document_tags(tag, created_at, document_id);
+-- Point lookups for the second and later tags of a multi-tag filter
+CREATE INDEX IF NOT EXISTS idx_document_tags_document_tag ON document_tags(document_id, tag);
+"""
+
+# Triggers keeping document_tags in sync with documents.tags, in each backend's dialect
+SQLITE_TAG_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS documents_tags_ai AFTER INSERT ON documents BEGIN
+    DELETE FROM document_tags WHERE document_id = new.id;
+    INSERT INTO document_tags (document_id, tag, created_at)
+        SELECT DISTINCT new.id, value, new.created_at FROM json_each(new.tags) WHERE value != '';
+END;
+CREATE TRIGGER IF NOT EXISTS documents_tags_au AFTER UPDATE OF tags, created_at ON documents BEGIN
+    DELETE FROM document_tags WHERE document_id = new.id;
+    INSERT INTO document_tags (document_id, tag, created_at)
+        SELECT DISTINCT new.id, value, new.created_at FROM json_each(new.tags) WHERE value != '';
+END;
+CREATE TRIGGER IF NOT EXISTS documents_tags_ad AFTER DELETE ON documents BEGIN
+    DELETE FROM document_tags WHERE document_id = old.id;
+END;
+"""
+
+POSTGRES_TAG_TRIGGERS = """
+CREATE OR REPLACE FUNCTION documents_sync_tags() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        DELETE FROM document_tags WHERE document_id = OLD.id;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        INSERT INTO document_tags (document_id, tag, created_at)
+            SELECT DISTINCT NEW.id, value, NEW.created_at
+            FROM jsonb_array_elements_text(COALESCE(NEW.tags, '[]')::jsonb) AS value WHERE value <> '';
+    END IF;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS documents_tags ON documents;
+CREATE TRIGGER documents_tags AFTER INSERT OR DELETE OR UPDATE OF tags, created_at ON documents
+    FOR EACH ROW EXECUTE FUNCTION documents_sync_tags();
+"""
+
+SCHEMAS = {"sqlite": SCHEMA + SQLITE_TAG_TRIGGERS, "postgresql": SCHEMA + POSTGRES_TAG_TRIGGERS}
+
+LIST_FILTERS = ("category", "language", "status", "uploaded_by")
+
+class MetadataTable(MutableMapping):
+    # dict-like view over one table of the shared store; rows are turned into model objects
+    # only when accessed, so every worker process sees the same data
+
+    def __init__(self, table, model, columns, json_columns=(), bool_columns=()):
+        self.table = table
+        self.model = model
+        self.columns = columns
+        self.json_columns = set(json_columns)
+        self.bool_columns = set(bool_columns)
+        self.select_sql = f"SELECT {', '.join(columns)} FROM {table}"
+        self.upsert_sql = (
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT (id) DO UPDATE SET "
+            + ", ".join(f"{column} = excluded.{column}" for column in columns if column != "id")
+        )
+
+    def encode(self, column, value):
+        if column in self.json_columns:
+            return json.dumps(value)
+        if column in self.bool_columns:
+            return int(bool(value))
+        if isinstance(value, datetime):
+            return format_datetime(value)
+        if value is not None and not isinstance(value, (str, int, float)):
+            return str(value)
+        return value
+
+    def to_row(self, obj) -> tuple:
+        return tuple(self.encode(column, getattr(obj, column)) for column in self.columns)
+
+    def from_row(self, row):
+        values = dict(zip(self.columns, row))
+        for column in self.json_columns:
+            values[column] = json.loads(values[column]) if values[column] else []
+        for column in self.bool_columns:
+            values[column] = bool(values[column])
+        # Datetime columns are parsed back by the model
+        return self.model(**values)
+
+    def __getitem__(self, key):
+        row = get_connection().execute(f"{self.select_sql} WHERE id = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return self.from_row(row)
+
+    def __setitem__(self, key, obj):
+        get_connection().execute(self.upsert_sql, self.to_row(obj))
+
+    def __delitem__(self, key):
+        cursor = get_connection().execute(f"DELETE FROM {self.table} WHERE id = ?", (key,))
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        row = get_connection().execute(f"SELECT 1 FROM {self.table} WHERE id = ?", (key,)).fetchone()
+        return row is not None
+
+    def __iter__(self):
+        for (key,) in get_connection().execute(f"SELECT id FROM {self.table}"):
+            yield key
+
+    def __len__(self):
+        return get_connection().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def values(self):
+        # Single streaming query instead of one lookup per key
+        for row in get_connection().execute(self.select_sql):
+            yield self.from_row(row)
+
+    def items(self):
+        for obj in self.values():
+            yield obj.id, obj
+
+    def find(self, limit: int = None, for_update: bool = False, **filters) -> list:
+        # for_update locks the matched rows until the surrounding transaction ends
+        where = " AND ".join(f"{column} = ?" for column in filters)
+        sql = f"{self.select_sql} WHERE {where}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        if for_update:
+            sql += storage.backend.row_lock
+        # Encoded like stored values, e.g. embedded=False binds 0 for the INTEGER column
+        params = tuple(self.encode(column, value) for column, value in filters.items())
+        rows = get_connection().execute(sql, params)
+        return [self.from_row(row) for row in rows]
+
+    def update(self, key, **fields) -> bool:
+        # Changes only the given columns and never resurrects a deleted row
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        params = [self.encode(column, value) for column, value in fields.items()]
+        cursor = get_connection().execute(
+            f"UPDATE {self.table} SET {assignments} WHERE id = ?", (*params, key)
+        )
+        return cursor.rowcount > 0
+
+documents_db = MetadataTable(
+    "documents", Document,
+    ["id", "title", "file_name", "tags", "language", "category", "uploaded_by",
+     "created_at", "updated_at", "versions", "status"],
+    json_columns=["tags", "versions"]
+)
+versions_db = MetadataTable(
+    "versions", DocumentVersion,
+    ["id", "document_id", "version_number", "file_path", "file_hash", "embedded", "created_at"],
+    bool_columns=["embedded"]
+)
+
+def copy_and_hash(source, file_path: str) -> str:
+    # Single pass over the upload: constant memory, hashed while it is written
+    sha = hashlib.sha256()
     with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(upload_file.file, buffer)
+        for block in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b""):
+            sha.update(block)
+            buffer.write(block)
+    return sha.hexdigest()
+
+def find_blob(file_hash: str, extension: str):
+    # An existing stored file with the same content (and parser) can be shared. The versions
+    # referencing it stay locked until the caller's transaction ends, so a concurrent delete
+    # cannot drop the blob in between.
+    for version in versions_db.find(for_update=True, file_hash=file_hash):
+        if os.path.splitext(version.file_path)[1].lower() == extension and os.path.exists(version.file_path):
+            return version.file_path
+    return None
+
+async def stage_upload(upload_file: UploadFile, key: str) -> tuple:
+    # Copies the upload next to the stored files; returns (staged_path, file_hash).
+    # store_blob turns it into a stored file once a version references it.
+    staged_path = os.path.join(UPLOAD_DIR, f".{key}.part")
+    try:
+        file_hash = await run_in_threadpool(copy_and_hash, upload_file.file, staged_path)
+    except BaseException:
+        discard_staged(staged_path)
+        raise
+    return staged_path, file_hash
+
+def discard_staged(staged_path: str):
+    if os.path.exists(staged_path):
+        os.remove(staged_path)
+
+def store_blob(staged_path: str, file_hash: str, file_name: str, key: str) -> str:
+    # Call inside the transaction that inserts the referencing version; returns the file path.
+    # Duplicate content is stored only once.
+    existing_path = find_blob(file_hash, os.path.splitext(file_name)[1].lower())
+    if existing_path:
+        discard_staged(staged_path)
+        return existing_path
+    file_path = os.path.join(UPLOAD_DIR, f"{key}_{file_name}")
+    os.replace(staged_path, file_path)
     return file_path
 
 def calculate_file_hash(file_path: str) -> str:
+    sha = hashlib.sha256()
     with open(file_path, 'rb') as f:
-        return hashlib.sha256(f.read()).hexdigest()
+        for block in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            sha.update(block)
+    return sha.hexdigest()
 
-def save_db_to_disk():
-    data = {
-        "documents": {k: vars(v) for k, v in documents_db.items()},
-        "versions": {k: vars(v) for k, v in versions_db.items()}
-    }
-    with open(DB_CACHE_FILE, "w") as f:
-        json.dump(data, f, default=str, indent=2)
+def remove_unreferenced_file(file_path: str, file_hash: str):
+    # Blobs can be shared by several versions after deduplication. Call inside the transaction
+    # that removed the references: uploads adopt blobs under the same lock (find_blob).
+    # Sharing versions have the same hash, so the lookup goes through idx_versions_hash.
+    referenced = any(version.file_path == file_path for version in versions_db.find(file_hash=file_hash))
+    if not referenced and os.path.exists(file_path):
+        os.remove(file_path)
 
-def load_db_from_disk():
-    if not os.path.exists(DB_CACHE_FILE):
+def document_versions(doc_id: str) -> list:
+    # Oldest first
+    return sorted(versions_db.find(document_id=doc_id), key=lambda v: v.version_number)
+
+def latest_version(doc_id: str):
+    versions = document_versions(doc_id)
+    return versions[-1] if versions else None
+
+def save_document(doc, *versions):
+    # Writes only the rows that changed, atomically
+    with transaction():
+        documents_db[doc.id] = doc
+        for version in versions:
+            versions_db[version.id] = version
+
+def create_document(doc, staged_path: str, file_hash: str):
+    # Stores a new document with its first version from a staged upload; returns the version
+    try:
+        with transaction():
+            file_path = store_blob(staged_path, file_hash, doc.file_name, doc.id)
+            version = DocumentVersion(doc.id, version_number=1, file_path=file_path, file_hash=file_hash)
+            doc.versions.append(version.id)
+            save_document(doc, version)
+        return version
+    finally:
+        discard_staged(staged_path)
+
+def add_document_version(doc_id: str, version_id: str, file_name: str, staged_path: str, file_hash: str) -> tuple:
+    # Returns (document, version, created); (None, None, False) when the document no longer exists.
+    # The document row stays locked (on SQLite, the whole store) until the version is saved, so
+    # concurrent uploads get distinct version numbers and keep each other's doc.versions entries.
+    # The staged upload is only stored when a version is created.
+    try:
+        with transaction():
+            docs = documents_db.find(for_update=True, id=doc_id)
+            if not docs:
+                return None, None, False
+            doc = docs[0]
+            current = latest_version(doc_id)
+            if current is not None and current.file_hash == file_hash:
+                return doc, current, False
+            file_path = store_blob(staged_path, file_hash, file_name, version_id)
+            version = DocumentVersion(
+                doc_id, version_number=current.version_number + 1 if current else 1,
+                file_path=file_path, file_hash=file_hash, id=version_id
+            )
+            doc.versions.append(version.id)
+            doc.file_name = file_name
+            doc.status = "uploaded"
+            doc.updated_at = datetime.utcnow()
+            save_document(doc, version)
+            # Other workers drop cached answers built from the previous version
+            publish_change("version_added", doc_id)
+        return doc, version, True
+    finally:
+        discard_staged(staged_path)
+
+def import_json_store(conn):
+    # One-off import of the legacy cms_data.json; its datetimes were written with str() and
+    # are parsed back by the models
+    if os.path.exists(DB_CACHE_FILE):
+        with open(DB_CACHE_FILE, "r") as f:
+            data = json.load(f)
+        for v in data.get("documents", {}).values():
+            documents_db[v["id"]] = Document(**v)
+        for v in data.get("versions", {}).values():
+            versions_db[v["id"]] = DocumentVersion(**v)
+
+def backfill_document_tags(conn):
+    # Only SQLite stores predate document_tags; other backends had the trigger from the start
+    if storage.backend.name != "sqlite":
         return
-    with open(DB_CACHE_FILE, "r") as f:
-        data = json.load(f)
-    for k, v in data.get("documents", {}).items():
-        doc = Document(**v)
-        documents_db[k] = doc
-    for k, v in data.get("versions", {}).items():
-        ver = DocumentVersion(**v)
-        versions_db[k] = ver
-
-# Load data when service is imported
-load_db_from_disk()
+    conn.execute("DELETE FROM document_tags")
+    conn.execute(
+        "INSERT INTO document_tags (document_id, tag, created_at) "
+        "SELECT DISTINCT d.id, j.value, d.created_at FROM documents d, json_each(d.tags) j WHERE j.value != ''"
+    )
+
+def normalize_datetimes(conn):
+    # Earlier rows hold str(datetime), which drops ".000000" when microseconds are 0;
+    # pad them to the fixed-width format so text order matches time order
+    for table, columns in (("documents", ("created_at", "updated_at")), ("versions", ("created_at",))):
+        for column in columns:
+            conn.execute(
+                f"UPDATE {table} SET {column} = {column} || '.000000' WHERE length({column}) = 19"
+            )
+
+def unique_version_numbers(conn):
+    # Backs up the row lock in add_document_version
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_versions_document_number ON versions(document_id, version_number)"
+    )
+
+def drop_document_tags_document_index(conn):
+    # Superseded by idx_document_tags_document_tag, which serves the same lookups
+    conn.execute("DROP INDEX IF EXISTS idx_document_tags_document")
+
+# Applied in order; the backend's schema version records how many have run
+MIGRATIONS = [
+    import_json_store, backfill_document_tags, normalize_datetimes, unique_version_numbers,
+    drop_document_tags_document_index
+]
+
+def migrate():
+    storage.migrate(MIGRATIONS)
+
+def encode_cursor(created_at: str, doc_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([created_at, doc_id]).encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    # Raises ValueError for anything encode_cursor could not have produced
+    value = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not (isinstance(value, list) and len(value) == 2 and all(isinstance(v, str) for v in value)):
+        raise ValueError("Malformed cursor")
+    created_at, doc_id = value
+    return created_at, doc_id
+
+def list_documents(limit: int = 50, cursor: str = None, tags: list = None,
+                   created_after: str = None, created_before: str = None, **filters) -> tuple:
+    # Newest first, keyset-paginated on (created_at, id) so every page is an index range scan.
+    # Returns (documents, next_cursor).
+    tags = [t for t in (tags or []) if t]
+    if tags:
+        # The first tag drives the scan through idx_document_tags_tag
+        source = "document_tags k JOIN documents d ON d.id = k.document_id"
+        order_created, order_id = "k.created_at", "k.document_id"
+        where, params = ["k.tag = ?"], [tags[0]]
+        for tag in tags[1:]:
+            # Probed through idx_document_tags_document_tag: one index seek per candidate row
+            where.append("EXISTS (SELECT 1 FROM document_tags t WHERE t.document_id = d.id AND t.tag = ?)")
+            params.append(tag)
+    else:
+        source = "documents d"
+        order_created, order_id = "d.created_at", "d.id"
+        where, params = [], []
+
+    for column in LIST_FILTERS:
+        if filters.get(column) is not None:
+            where.append(f"d.{column} = ?")
+            params.append(filters[column])
+    if created_after is not None:
+        where.append(f"{order_created} >= ?")
+        params.append(created_after)
+    if created_before is not None:
+        where.append(f"{order_created} < ?")
+        params.append(created_before)
+    if cursor:
+        where.append(f"({order_created}, {order_id}) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+
+    columns = ", ".join(f"d.{column}" for column in documents_db.columns)
+    sql = f"SELECT {columns} FROM {source}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {order_created} DESC, {order_id} DESC LIMIT ?"
+    params.append(limit + 1)
+
+    docs = [documents_db.from_row(row) for row in get_connection().execute(sql, params)]
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(format_datetime(docs[-1].created_at), docs[-1].id)
+    return docs, next_cursor
+
+def load_db_from_disk():
+    # Only prepares the store; rows are read on demand. Called from the app's startup
+    # (services/lifecycle.py) rather than at import, so importing is cheap.
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    storage.apply_schema(SCHEMAS[storage.backend.name])
+    migrate()
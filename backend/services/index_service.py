@@ -0,0 +1,176 @@
+# services/index_service.py
+
+import os
+import re
+import sqlite3
+import hashlib
+import threading
+from services.storage import SQLITE_MMAP_SIZE
+
+INDEX_DB_FILE = "./search_index.db"
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1200"))        # characters per chunk
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))   # characters shared by neighbouring chunks
+TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+
+# Very common words only add posting-list scans without helping the ranking
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "does", "for", "from", "how", "i",
+    "in", "is", "it", "me", "my", "of", "on", "or", "that", "the", "this", "to", "was", "what",
+    "when", "where", "which", "who", "why", "with", "you", "your"
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    document_id TEXT NOT NULL,
+    version_id TEXT NOT NULL,
+    chunk_no INTEGER NOT NULL,
+    chunk_hash TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_document ON chunks(document_id);
+CREATE INDEX IF NOT EXISTS idx_chunks_version ON chunks(version_id);
+CREATE TABLE IF NOT EXISTS indexed_versions (
+    document_id TEXT PRIMARY KEY,
+    version_number INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+    text, content='chunks', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+    INSERT INTO chunks_fts(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+    INSERT INTO chunks_fts(chunks_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+_local = threading.local()
+
+def get_connection() -> sqlite3.Connection:
+    # One connection per thread: sync routes run in the threadpool
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(INDEX_DB_FILE, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+def chunk_text(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> list:
+    text = re.sub(r"[ \t]+", " ", text).strip()
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            # Prefer to cut on whitespace in the second half of the window
+            cut = max(text.rfind("\n", start + size // 2, end), text.rfind(" ", start + size // 2, end))
+            if cut > start:
+                end = cut
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+        # Do not start the next chunk in the middle of a word
+        space = text.find(" ", start, end)
+        if space != -1:
+            start = space + 1
+    return chunks
+
+def chunk_pages(pages: list) -> list:
+    # Page-aligned chunks: editing one page leaves the chunks of every other page unchanged
+    return [chunk for page in pages for chunk in chunk_text(page)]
+
+def chunk_hash(chunk: str) -> str:
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+def index_chunks(version, chunks: list) -> dict:
+    # Makes `chunks` the indexed content of the version's document in one transaction.
+    # Chunks already indexed for the document (same hash) are kept and re-pointed at the new
+    # version, so a revision only writes its changed chunks to the full-text index and
+    # searches never see a mix of versions.
+    # Returns None without touching the index if a newer version has already been indexed.
+    conn = get_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")  # the diff must not race another writer of the same document
+        row = conn.execute(
+            "SELECT version_number FROM indexed_versions WHERE document_id = ?", (version.document_id,)
+        ).fetchone()
+        if row and row[0] > version.version_number:
+            return None
+        existing = {}
+        for row_id, existing_hash in conn.execute(
+            "SELECT id, chunk_hash FROM chunks WHERE document_id = ?", (version.document_id,)
+        ):
+            existing.setdefault(existing_hash, []).append(row_id)
+        kept, added = [], []
+        for i, chunk in enumerate(chunks):
+            h = chunk_hash(chunk)
+            if existing.get(h):
+                kept.append((version.id, i, existing[h].pop()))
+            else:
+                added.append((version.document_id, version.id, i, h, chunk))
+        removed = [(row_id,) for row_ids in existing.values() for row_id in row_ids]
+        conn.executemany("DELETE FROM chunks WHERE id = ?", removed)
+        # Only unindexed columns change here, so the FTS table is not touched
+        conn.executemany("UPDATE chunks SET version_id = ?, chunk_no = ? WHERE id = ?", kept)
+        conn.executemany(
+            "INSERT INTO chunks (document_id, version_id, chunk_no, chunk_hash, text) VALUES (?, ?, ?, ?, ?)",
+            added
+        )
+        conn.execute(
+            "INSERT INTO indexed_versions (document_id, version_number) VALUES (?, ?) "
+            "ON CONFLICT (document_id) DO UPDATE SET version_number = excluded.version_number",
+            (version.document_id, version.version_number)
+        )
+    return {"kept": len(kept), "added": len(added), "removed": len(removed)}
+
+def remove_document(document_id: str):
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM chunks WHERE document_id = ?", (document_id,))
+        conn.execute("DELETE FROM indexed_versions WHERE document_id = ?", (document_id,))
+
+def indexed_version_ids() -> set:
+    rows = get_connection().execute("SELECT DISTINCT version_id FROM chunks").fetchall()
+    return {row[0] for row in rows}
+
+def query_terms(query: str) -> list:
+    terms = [t for t in re.findall(r"\w+", query.lower()) if t not in STOPWORDS]
+    return terms or re.findall(r"\w+", query.lower())
+
+def build_match_query(query: str) -> str:
+    terms = query_terms(query)
+    # Quote every term so user input can never be parsed as FTS5 syntax
+    return " OR ".join(f'"{t}"' for t in dict.fromkeys(terms))
+
+def search(query: str, top_k: int = TOP_K, document_ids: list = None) -> list:
+    match = build_match_query(query)
+    if not match:
+        return []
+    sql = (
+        "SELECT c.document_id, c.version_id, c.chunk_no, c.chunk_hash, c.text, bm25(chunks_fts) AS score "
+        "FROM chunks_fts JOIN chunks c ON c.id = chunks_fts.rowid "
+        "WHERE chunks_fts MATCH ?"
+    )
+    params = [match]
+    if document_ids:
+        sql += f" AND c.document_id IN ({', '.join('?' * len(document_ids))})"
+        params.extend(document_ids)
+    sql += " ORDER BY score LIMIT ?"
+    params.append(top_k)
+    rows = get_connection().execute(sql, params).fetchall()
+    return [{
+        "document_id": row[0],
+        "version_id": row[1],
+        "chunk_no": row[2],
+        "hash": row[3],
+        "text": row[4],
+        # bm25() is lower-is-better; flip it so callers can sort descending
+        "score": -row[5]
+    } for row in rows]
@@ -0,0 +1,187 @@
+# services/ingest_service.py
+
+import os
+import sys
+import time
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from services.file_service import documents_db, versions_db, document_versions, load_db_from_disk
+from services import context_builder, index_service, metrics, text_service
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 2)))
+
+logger = logging.getLogger(__name__)
+
+# Counters since process start, exposed through GET /api/ingest/status.
+# "queued" versions wait for a free pool worker, "processing" ones hold one.
+progress = {"queued": 0, "processing": 0, "indexed": 0, "failed": 0}
+
+_executor = None
+_slots = None
+_running = {}  # version id -> task ingesting it in this process; also keeps the task referenced
+
+def get_executor() -> ProcessPoolExecutor:
+    # PyPDF2 is pure Python and holds the GIL, so extraction runs in processes
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=INGEST_WORKERS)
+    return _executor
+
+def get_slots() -> asyncio.Semaphore:
+    # One slot per pool worker; created on first use so it belongs to the running loop
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(INGEST_WORKERS)
+    return _slots
+
+def extract_and_chunk(file_path: str, file_hash: str, previous_hash: str = None) -> tuple:
+    # Runs in a worker process; the extracted text lands in the shared on-disk cache.
+    # Pages unchanged since the previous version (`previous_hash`) are not parsed again.
+    # Returns (chunks, stats) so the parent can record metrics.
+    started = time.perf_counter()
+    pages, parsed, reused = text_service.load_pages(file_path, file_hash, previous_hash)
+    extract_seconds = time.perf_counter() - started
+    chunks = index_service.chunk_pages(context_builder.strip_boilerplate(pages))
+    return chunks, {"pages": len(pages), "parsed": parsed, "reused": reused, "seconds": extract_seconds}
+
+def set_status(doc_id: str, status: str):
+    documents_db.update(doc_id, status=status, updated_at=datetime.utcnow())
+
+def mark_superseded(version_id: str):
+    # Only the latest version is indexed; an older one has nothing left to do, and marking it
+    # keeps it out of queue_pending_versions and batch preparation
+    versions_db.update(version_id, embedded=True)
+
+def load_version(version_id: str) -> tuple:
+    # Returns (version, document, previous version). The document is None when the version or
+    # its document is gone, or when the version was superseded before it was processed.
+    version = versions_db.get(version_id)
+    doc = documents_db.get(version.document_id) if version else None
+    if not doc:
+        return version, None, None
+    versions = document_versions(doc.id)
+    if versions[-1].id != version_id:
+        mark_superseded(version_id)
+        return version, None, None
+    return version, doc, versions[-2] if len(versions) > 1 else None
+
+async def ingest_version(version_id: str) -> bool:
+    # Waits for a free pool worker first, so documents only show as processing while they are
+    slots = get_slots()
+    progress["queued"] += 1
+    try:
+        await slots.acquire()
+    finally:
+        progress["queued"] -= 1
+    try:
+        return await process_version(version_id)
+    finally:
+        slots.release()
+
+async def process_version(version_id: str) -> bool:
+    # Store calls block while another worker holds the write lock, so they run in threads
+    version, doc, previous = await asyncio.to_thread(load_version, version_id)
+    if not doc:
+        return False
+
+    progress["processing"] += 1
+    await asyncio.to_thread(set_status, doc.id, "processing")
+    try:
+        loop = asyncio.get_running_loop()
+        chunks, stats = await loop.run_in_executor(
+            get_executor(), extract_and_chunk,
+            version.file_path, version.file_hash, previous.file_hash if previous else None
+        )
+        metrics.record("extract", stats["seconds"])
+        if stats["parsed"]:
+            metrics.extraction_page_seconds.observe(stats["seconds"] / stats["parsed"])
+        metrics.extracted_pages.inc(stats["parsed"], outcome="parsed")
+        metrics.extracted_pages.inc(stats["reused"], outcome="reused")
+        with metrics.timed("index"):
+            changes = await asyncio.to_thread(index_service.index_chunks, version, chunks)
+        if changes is None:
+            # A newer version was added and indexed while this one was being extracted
+            logger.info("Skipped superseded version %s", version_id)
+            await asyncio.to_thread(mark_superseded, version_id)
+            return False
+        logger.info(
+            "Indexed version %s: %d/%d pages reused, chunks kept %d, added %d, removed %d",
+            version_id, stats["reused"], stats["pages"], changes["kept"], changes["added"], changes["removed"]
+        )
+    except Exception:
+        logger.exception("Ingestion failed for version %s", version_id)
+        progress["failed"] += 1
+        await asyncio.to_thread(set_status, doc.id, "failed")
+        return False
+    finally:
+        progress["processing"] -= 1
+
+    if not await asyncio.to_thread(versions_db.update, version_id, embedded=True):
+        # Deleted while it was being processed
+        await asyncio.to_thread(index_service.remove_document, version.document_id)
+        return False
+    progress["indexed"] += 1
+    await asyncio.to_thread(set_status, doc.id, "indexed")
+    return True
+
+def queue_version(version_id: str) -> asyncio.Task:
+    # Starts ingesting the version in the background, or returns the task already doing it
+    task = _running.get(version_id)
+    if task is None:
+        task = asyncio.get_running_loop().create_task(ingest_version(version_id))
+        _running[version_id] = task
+        task.add_done_callback(lambda _: _running.pop(version_id, None))
+    return task
+
+async def wait_for_version(version_id: str) -> bool:
+    # Joins an ingestion already in flight instead of extracting the file a second time.
+    # Shielded: a caller that gives up does not cancel the ingestion for everyone else.
+    return await asyncio.shield(queue_version(version_id))
+
+async def queue_pending_versions() -> int:
+    # Versions that were uploaded but never finished processing (e.g. server restarted mid-way)
+    pending = [v.id for v in await asyncio.to_thread(versions_db.find, embedded=False)]
+    for version_id in pending:
+        queue_version(version_id)
+    return len(pending)
+
+def versions_to_reindex(only_missing: bool = False) -> list:
+    # Only each document's latest version is searchable
+    indexed = index_service.indexed_version_ids() if only_missing else set()
+    latest = {}
+    for version in versions_db.values():
+        current = latest.get(version.document_id)
+        if current is None or version.version_number > current.version_number:
+            latest[version.document_id] = version
+    return [v.id for v in latest.values() if v.id not in indexed]
+
+async def reindex_all(only_missing: bool = False) -> dict:
+    # The corpus scans run in a thread; a fixed set of workers then pulls version ids from a
+    # shared iterator, so there is never more than one task per worker
+    version_ids = await asyncio.to_thread(versions_to_reindex, only_missing)
+    pending = iter(version_ids)
+    results = {"indexed": 0, "failed": 0}
+
+    async def worker():
+        for version_id in pending:
+            results["indexed" if await wait_for_version(version_id) else "failed"] += 1
+
+    await asyncio.gather(*(worker() for _ in range(min(INGEST_WORKERS, len(version_ids)))))
+    return {"total": len(version_ids), **results}
+
+def shutdown():
+    global _executor, _slots
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    _slots = None
+
+if __name__ == "__main__":
+    # Bulk re-index of the existing corpus: python -m services.ingest_service [--missing]
+    logging.basicConfig(level=logging.INFO)
+    load_db_from_disk()
+    summary = asyncio.run(reindex_all(only_missing="--missing" in sys.argv[1:]))
+    shutdown()
+    print(summary)
@@ -0,0 +1,60 @@
+# services/lifecycle.py
+#
+# Deferred startup. The process answers liveness probes as soon as it is listening, while the
+# metadata store is prepared in the background; data routes answer 503 until it is ready.
+
+import time
+import asyncio
+import logging
+from fastapi import HTTPException
+from services import answer_cache, file_service, ingest_service, llm_client, storage
+
+RESUME_LEASE = "resume-pending-ingest"
+RESUME_LEASE_TTL = 60  # workers starting within this window leave resuming to the first one
+
+logger = logging.getLogger(__name__)
+
+state = {"ready": False, "error": None, "startup_s": None}
+
+_started = time.perf_counter()
+_tasks = []
+_resumed = False
+
+def on_store_change(kind: str, document_id: str):
+    # Changes committed by any worker; keeps this process's answer cache in step
+    if document_id:
+        answer_cache.invalidate_document(document_id)
+
+async def initialize():
+    global _resumed
+    try:
+        await asyncio.to_thread(file_service.load_db_from_disk)
+        # Resume versions that were uploaded but not processed before the last shutdown.
+        # With several workers only the one holding the lease does it.
+        _resumed = await asyncio.to_thread(storage.acquire_lease, RESUME_LEASE, RESUME_LEASE_TTL)
+        if _resumed:
+            await ingest_service.queue_pending_versions()
+        _tasks.append(asyncio.create_task(storage.watch_changes(on_store_change)))
+    except Exception as e:
+        logger.exception("Startup failed")
+        state["error"] = str(e)
+        return
+    state["ready"] = True
+    state["startup_s"] = round(time.perf_counter() - _started, 3)
+    logger.info("Ready after %.3fs", state["startup_s"])
+
+def start():
+    _tasks.append(asyncio.get_running_loop().create_task(initialize()))
+
+async def stop():
+    for task in _tasks:
+        task.cancel()
+    if _resumed:
+        await asyncio.to_thread(storage.release_lease, RESUME_LEASE)
+    ingest_service.shutdown()
+    await llm_client.close()
+
+def require_ready():
+    # Router dependency for everything that touches the metadata store
+    if not state["ready"]:
+        raise HTTPException(status_code=503, detail="Service is starting", headers={"Retry-After": "1"})
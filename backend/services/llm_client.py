@@ -0,0 +1,84 @@
+# services/llm_client.py
+
+import os
+import asyncio
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "sk-3fv-EeXCjYP3xeigsr9O3w")
+OPENAI_ENDPOINT = os.getenv("OPENAI_ENDPOINT", "https://aiportalapi.stu-platform.live/jpe")
+MODEL_NAME = os.getenv("OPENAI_MODEL", "GPT-4.1")
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))      # in-flight completions per process
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))      # pooled keep-alive connections
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))                    # seconds, per read/write
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+_client = None
+_semaphore = None
+_loop = None
+
+def get_client():
+    # The pool belongs to the event loop that created it; rebuild if the loop changed
+    global _client, _semaphore, _loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _loop is not loop:
+        # Imported on first use: openai alone takes most of the API's import time
+        import httpx
+        from openai import AsyncOpenAI
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                keepalive_expiry=30
+            ),
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+        )
+        _client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            base_url=OPENAI_ENDPOINT,
+            http_client=http_client,
+            max_retries=LLM_MAX_RETRIES
+        )
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        _loop = loop
+    return _client
+
+async def complete(messages: list, max_tokens: int = 500, temperature: float = 0.7) -> str:
+    client = get_client()
+    async with _semaphore:
+        response = await client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature
+        )
+    return response.choices[0].message.content
+
+async def stream(messages: list, max_tokens: int = 500, temperature: float = 0.7):
+    # Yields the answer text as it is generated
+    client = get_client()
+    async with _semaphore:
+        response = await client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+def errors() -> tuple:
+    # Exceptions that mean the LLM call failed (HTTP status, connection, timeout) rather than a bug.
+    # Imported here for the same reason as in get_client().
+    import httpx
+    import openai
+    return (openai.APIError, httpx.HTTPError, asyncio.TimeoutError)
+
+async def close():
+    global _client, _loop
+    if _client is not None:
+        await _client.close()
+        _client = None
+        _loop = None
@@ -0,0 +1,139 @@
+# services/metrics.py
+#
+# Small in-process Prometheus-style registry (histograms, counters, callback gauges)
+# plus per-request stage timings for the Server-Timing header.
+
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1000, 2000, 3000, 4000, 8000, 16000, 32000)
+
+_lock = threading.Lock()
+_registry = {}
+
+# Stage timings of the current request: list of (stage, seconds)
+request_timings = ContextVar("request_timings", default=None)
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{escape_label(v)}"' for k, v in labels) + "}"
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * (len(self.buckets) + 2)
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):  # larger values only show up in +Inf
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            items = [(key, list(series)) for key, series in self.series.items()]
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(key + (('le', bound),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{format_labels(key + (('le', '+Inf'),))} {series[-1]}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_count{format_labels(key)} {series[-1]}")
+        return lines
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.series = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with _lock:
+            items = list(self.series.items())
+        lines.extend(f"{self.name}{format_labels(key)} {value}" for key, value in items)
+        return lines
+
+class CallbackGauge:
+    # Value is read from a callback at scrape time, e.g. cache statistics kept elsewhere
+    def __init__(self, name, help_text, callback):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        for labels, value in self.callback():
+            lines.append(f"{self.name}{format_labels(tuple(sorted(labels.items())))} {value}")
+        return lines
+
+def register(metric):
+    _registry[metric.name] = metric
+    return metric
+
+request_seconds = register(Histogram("cms_request_seconds", "HTTP request latency by endpoint"))
+stage_seconds = register(Histogram("cms_stage_seconds", "Time spent per processing stage"))
+extraction_page_seconds = register(Histogram(
+    "cms_extraction_seconds_per_page", "Text extraction time divided by page count",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+))
+prompt_tokens = register(Histogram("cms_prompt_context_tokens", "Document context tokens per prompt", TOKEN_BUCKETS))
+extracted_pages = register(Counter(
+    "cms_extracted_pages_total", "Pages parsed during ingestion, or reused unchanged from the previous version"
+))
+slow_profiles = register(Counter("cms_slow_request_profiles_total", "Profiles written for slow sampled requests"))
+answers = register(Counter(
+    "cms_answers_total", "Answers by the engine that produced them and why (requested, lookup, fallback)"
+))
+
+def record(stage: str, seconds: float):
+    stage_seconds.observe(seconds, stage=stage)
+    timings = request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+@contextmanager
+def timed(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+def server_timing_header(timings: list, total: float) -> str:
+    # Repeated stages (e.g. several db writes) are summed
+    merged = {}
+    for stage, seconds in timings:
+        merged[stage] = merged.get(stage, 0.0) + seconds
+    parts = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in merged.items()]
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
+
+def render() -> str:
+    lines = []
+    for metric in list(_registry.values()):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,48 @@
+# services/preview_service.py
+
+from fastapi import Request
+from fastapi.responses import FileResponse, JSONResponse, Response
+from services import text_service
+
+def make_etag(file_hash: str, suffix: str = "") -> str:
+    # Content-addressed: the same bytes always produce the same ETag
+    return f'"{file_hash}{suffix}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+def file_response(request: Request, file_path: str, file_hash: str, file_name: str, media_type: str):
+    etag = make_etag(file_hash)
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=0, must-revalidate"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    # FileResponse reads Range/If-Range from the request itself (206, multipart ranges, 416) and
+    # compares If-Range with our content-hash ETag; full responses use the server's zero-copy
+    # path (http.response.pathsend) when available
+    return FileResponse(file_path, media_type=media_type, filename=file_name, headers=headers)
+
+def text_preview(request: Request, doc, version, start_page: int, page_count: int):
+    # Pages come from the extracted-text cache; uncached PDFs only have the requested pages parsed
+    etag = make_etag(version.file_hash, f"-text-{start_page}-{page_count}")
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    total_pages, pages = text_service.get_page_range(version.file_path, version.file_hash, start_page - 1, page_count)
+    if start_page > max(total_pages, 1):
+        return JSONResponse(
+            status_code=416,
+            content={"detail": f"Page {start_page} is past the last page", "total_pages": total_pages}
+        )
+    return JSONResponse(
+        content={
+            "document_id": doc.id,
+            "version_id": version.id,
+            "version_number": version.version_number,
+            "total_pages": total_pages,
+            "pages": [{"number": start_page + i, "text": text} for i, text in enumerate(pages)]
+        },
+        headers={"ETag": etag, "Cache-Control": "private, max-age=0, must-revalidate"}
+    )
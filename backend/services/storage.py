@@ -0,0 +1,245 @@
+# services/storage.py
+#
+# Connection layer for the metadata store. SQLite (WAL) is shared by every worker on one host;
+# STORAGE_URL=postgresql://... switches to a server database shared by workers on several hosts.
+# Both speak the same SQL ("?" placeholders, ON CONFLICT upserts); dialect specifics live here.
+
+import os
+import time
+import socket
+import asyncio
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DB_FILE = "./cms_data.db"
+STORAGE_URL = os.getenv("STORAGE_URL", "")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # bytes read through mmap
+CHANGE_POLL_INTERVAL = float(os.getenv("CHANGE_POLL_INTERVAL", "1.0"))   # seconds between change feed polls
+CHANGE_RETENTION = 3600   # seconds a change row is kept for slow pollers
+CHANGE_OVERLAP = 100      # re-read window for sequence numbers committed out of order
+
+logger = logging.getLogger(__name__)
+
+# Process identity for leases
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+SQLITE_BASE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    document_id TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_changes_created ON changes(created_at);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+POSTGRES_BASE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS changes (
+    seq BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    document_id TEXT,
+    created_at DOUBLE PRECISION NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_changes_created ON changes(created_at);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at DOUBLE PRECISION NOT NULL
+);
+CREATE TABLE IF NOT EXISTS schema_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+INSERT INTO schema_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
+"""
+
+class SQLiteBackend:
+    name = "sqlite"
+    row_lock = ""  # BEGIN IMMEDIATE already holds the database write lock
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        return conn
+
+    def begin(self, conn):
+        # Takes the write lock up front, so concurrent workers queue instead of failing on upgrade
+        conn.execute("BEGIN IMMEDIATE")
+
+    def apply_schema(self, conn, schema: str):
+        # CREATE ... IF NOT EXISTS statements are safe to run from several processes at once
+        conn.executescript(SQLITE_BASE_SCHEMA + schema)
+
+    def get_schema_version(self, conn) -> int:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def set_schema_version(self, conn, version: int):
+        conn.execute(f"PRAGMA user_version = {int(version)}")
+
+class PostgresConnection:
+    # Adapts a psycopg connection to the sqlite3-style calls used by the services
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql: str, params=()):
+        return self.conn.execute(sql.replace("?", "%s"), params)
+
+    def executescript(self, script: str):
+        self.conn.execute(script)
+
+class PostgresBackend:
+    name = "postgresql"
+    row_lock = " FOR UPDATE"
+
+    def __init__(self, url: str):
+        try:
+            import psycopg  # optional dependency, only needed for this backend
+        except ImportError:
+            raise RuntimeError("STORAGE_URL points to PostgreSQL but psycopg is not installed (pip install psycopg)")
+        self.psycopg = psycopg
+        self.url = url
+
+    def connect(self):
+        return PostgresConnection(self.psycopg.connect(self.url, autocommit=True))
+
+    def begin(self, conn):
+        conn.execute("BEGIN")
+
+    def apply_schema(self, conn, schema: str):
+        # Concurrent CREATE IF NOT EXISTS can collide in PostgreSQL, so workers take turns
+        conn.execute("BEGIN")
+        try:
+            conn.execute("SELECT pg_advisory_xact_lock(72010)")
+            conn.executescript(POSTGRES_BASE_SCHEMA + schema)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get_schema_version(self, conn) -> int:
+        # Row lock: only one worker runs a given migration step
+        return conn.execute("SELECT version FROM schema_version WHERE id = 1 FOR UPDATE").fetchone()[0]
+
+    def set_schema_version(self, conn, version: int):
+        conn.execute("UPDATE schema_version SET version = ? WHERE id = 1", (version,))
+
+def create_backend(url: str):
+    if url.startswith(("postgres://", "postgresql://")):
+        return PostgresBackend(url)
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    if url:
+        raise RuntimeError(f"Unsupported STORAGE_URL: {url}")
+    return SQLiteBackend(DB_FILE)
+
+backend = create_backend(STORAGE_URL)
+
+_local = threading.local()
+
+def get_connection():
+    # One connection per thread; autocommit unless inside transaction()
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = backend.connect()
+        _local.conn = conn
+        _local.in_transaction = False
+    return conn
+
+@contextmanager
+def transaction():
+    # Groups several writes (e.g. a document and its version) into one atomic commit
+    conn = get_connection()
+    if _local.in_transaction:
+        yield conn
+        return
+    backend.begin(conn)
+    _local.in_transaction = True
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        _local.in_transaction = False
+
+def apply_schema(schema: str):
+    backend.apply_schema(get_connection(), schema)
+
+def migrate(migrations: list):
+    # Each step runs in its own transaction together with the version bump,
+    # so workers starting at the same time apply every step exactly once
+    while True:
+        with transaction() as conn:
+            version = backend.get_schema_version(conn)
+            if version >= len(migrations):
+                return
+            migrations[version](conn)
+            backend.set_schema_version(conn, version + 1)
+
+def publish_change(kind: str, document_id: str = None):
+    # Call inside the writer's transaction so the change is visible exactly when the data is
+    now = time.time()
+    conn = get_connection()
+    conn.execute(
+        "INSERT INTO changes (kind, document_id, created_at) VALUES (?, ?, ?)",
+        (kind, document_id, now)
+    )
+    conn.execute("DELETE FROM changes WHERE created_at < ?", (now - CHANGE_RETENTION,))
+
+def latest_change() -> int:
+    return get_connection().execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+def changes_since(seq: int) -> list:
+    return get_connection().execute(
+        "SELECT seq, kind, document_id FROM changes WHERE seq > ? ORDER BY seq", (seq,)
+    ).fetchall()
+
+async def watch_changes(callback, interval: float = CHANGE_POLL_INTERVAL):
+    # Delivers changes committed by any process (including this one) as callback(kind, document_id).
+    # Runs until cancelled.
+    start = last = await asyncio.to_thread(latest_change)
+    delivered = set()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            rows = await asyncio.to_thread(changes_since, max(last - CHANGE_OVERLAP, start))
+        except Exception:
+            logger.exception("Polling the change feed failed")
+            continue
+        for seq, kind, document_id in rows:
+            if seq in delivered:
+                continue
+            delivered.add(seq)
+            last = max(last, seq)
+            try:
+                callback(kind, document_id)
+            except Exception:
+                logger.exception("Change callback failed for %s %s", kind, document_id)
+        delivered = {seq for seq in delivered if seq > last - CHANGE_OVERLAP}
+
+def acquire_lease(name: str, ttl: float) -> bool:
+    # Cross-process mutual exclusion for one-off jobs (e.g. resuming pending ingestion on startup)
+    now = time.time()
+    cursor = get_connection().execute(
+        "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+        "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+        "WHERE leases.expires_at < ? OR leases.owner = excluded.owner",
+        (name, OWNER, now + ttl, now)
+    )
+    return cursor.rowcount > 0
+
+def release_lease(name: str):
+    get_connection().execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, OWNER))
@@ -0,0 +1,206 @@
+# services/text_service.py
+
+import os
+import json
+import hashlib
+import threading
+from io import BytesIO
+
+# Content-addressed cache of extracted text, keyed by the file's SHA-256
+TEXT_CACHE_DIR = "./extracted_text"
+TEXT_CACHE_MAX_BYTES = int(os.getenv("TEXT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+SUPPORTED_EXTENSIONS = (".txt", ".pdf")
+
+_lock = threading.Lock()
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def hash_file(file_path: str) -> str:
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+def hash_pdf_object(sha, obj, seen: set):
+    # Feeds a PDF object and everything it references into `sha`. Back references to the page
+    # tree (/Parent, /P) are skipped; objects reached twice are hashed once.
+    from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        if key in seen:
+            sha.update(f"R{key}".encode())
+            return
+        seen.add(key)
+        obj = obj.get_object()
+    if isinstance(obj, StreamObject):
+        sha.update(b"stream")
+        sha.update(obj.get_data())
+    if isinstance(obj, DictionaryObject):
+        sha.update(b"<<")
+        for name in sorted(obj):
+            if name not in ("/Parent", "/P"):
+                sha.update(name.encode())
+                hash_pdf_object(sha, obj.raw_get(name), seen)
+        sha.update(b">>")
+    elif isinstance(obj, ArrayObject):
+        sha.update(b"[")
+        for item in obj:
+            hash_pdf_object(sha, item, seen)
+        sha.update(b"]")
+    else:
+        sha.update(repr(obj).encode())
+
+def hash_page(page) -> str:
+    # Covers the content stream and the resources it draws with: form XObjects can hold the
+    # page's text, and fonts (ToUnicode maps) decide how it is extracted. A revision that
+    # leaves a page alone keeps its hash.
+    sha = hashlib.sha256()
+    contents = page.get_contents()
+    sha.update(contents.get_data() if contents is not None else b"")
+    hash_pdf_object(sha, page.get("/Resources"), set())
+    return sha.hexdigest()
+
+def extract_pdf(source, known: dict = None) -> tuple:
+    # Returns (pages, page_hashes, reused). Pages whose hash is in `known` (hash -> text,
+    # typically the previous version) are not parsed again.
+    import PyPDF2  # imported on first use to keep startup fast
+    known = known or {}
+    pdf_reader = PyPDF2.PdfReader(source)
+    pages, hashes, reused = [], [], 0
+    for page in pdf_reader.pages:
+        page_hash = hash_page(page)
+        text = known.get(page_hash)
+        if text is None:
+            text = page.extract_text() or ""
+        else:
+            reused += 1
+        pages.append(text)
+        hashes.append(page_hash)
+    return pages, hashes, reused
+
+def extract(source, file_name: str, known: dict = None) -> tuple:
+    # `source` is a path or a binary file object; `file_name` decides the parser.
+    # Returns (pages, page_hashes or None, reused pages).
+    name = file_name.lower()
+    if name.endswith(".txt"):
+        if isinstance(source, str):
+            with open(source, "r", encoding="utf-8") as f:
+                return [f.read()], None, 0
+        return [source.read().decode("utf-8")], None, 0
+    if name.endswith(".pdf"):
+        return extract_pdf(source, known)
+    return [], None, 0
+
+def _cache_path(file_hash: str) -> str:
+    return os.path.join(TEXT_CACHE_DIR, f"{file_hash}.json")
+
+def _read_entry(file_hash: str):
+    # {"pages": [...], "page_hashes": [...] (PDFs only)} or None
+    path = _cache_path(file_hash)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(entry, dict) or "pages" not in entry:
+        return None
+    # Touch on hit so eviction drops the least recently used entries first
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return entry
+
+def _read_cache(file_hash: str):
+    entry = _read_entry(file_hash)
+    return entry["pages"] if entry is not None else None
+
+def _write_cache(file_hash: str, pages: list, page_hashes: list = None):
+    path = _cache_path(file_hash)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    entry = {"pages": pages}
+    if page_hashes is not None:
+        entry["page_hashes"] = page_hashes
+    os.makedirs(TEXT_CACHE_DIR, exist_ok=True)
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, path)
+    # Every ingest worker process writes to the same directory, so its size is measured
+    # rather than counted per process
+    with _lock:
+        entries = _cache_entries()
+        if sum(size for _, size, _ in entries) > TEXT_CACHE_MAX_BYTES:
+            _evict(entries)
+
+def _cache_entries() -> list:
+    # (mtime, size, path) of every cache entry
+    entries = []
+    for entry in os.scandir(TEXT_CACHE_DIR):
+        if entry.name.endswith(".json"):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # evicted by another process meanwhile
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    return entries
+
+def _evict(entries: list):
+    # Drop least recently used entries until the cache is back under 90% of its budget
+    total = sum(size for _, size, _ in entries)
+    target = TEXT_CACHE_MAX_BYTES * 0.9
+    for _, size, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # already removed by another process
+        total -= size
+
+def known_pages(file_hash: str) -> dict:
+    # page hash -> text of an earlier extraction, used to skip unchanged pages
+    entry = _read_entry(file_hash) if file_hash else None
+    if not entry or "page_hashes" not in entry:
+        return {}
+    return dict(zip(entry["page_hashes"], entry["pages"]))
+
+def load_pages(file_path: str, file_hash: str = None, previous_hash: str = None) -> tuple:
+    # Returns (pages, pages parsed, pages reused from the previous version); both are 0 on a cache hit
+    if not file_path.lower().endswith(SUPPORTED_EXTENSIONS):
+        return [], 0, 0
+    file_hash = file_hash or hash_file(file_path)
+    pages = _read_cache(file_hash)
+    if pages is not None:
+        return pages, 0, 0
+    pages, page_hashes, reused = extract(file_path, file_path, known_pages(previous_hash))
+    _write_cache(file_hash, pages, page_hashes)
+    return pages, len(pages) - reused, reused
+
+def get_pages(file_path: str, file_hash: str = None) -> list:
+    return load_pages(file_path, file_hash)[0]
+
+def get_page_range(file_path: str, file_hash: str, start: int, count: int) -> tuple:
+    # Returns (total_pages, pages[start:start + count]) without extracting the whole file
+    pages = _read_cache(file_hash)
+    if pages is not None:
+        return len(pages), pages[start:start + count]
+    if file_path.lower().endswith(".pdf"):
+        import PyPDF2
+        pdf_reader = PyPDF2.PdfReader(file_path)
+        total = len(pdf_reader.pages)
+        return total, [pdf_reader.pages[i].extract_text() or "" for i in range(start, min(start + count, total))]
+    pages = get_pages(file_path, file_hash)
+    return len(pages), pages[start:start + count]
+
+def get_pages_from_bytes(data: bytes, file_name: str) -> list:
+    if not file_name.lower().endswith(SUPPORTED_EXTENSIONS):
+        return []
+    file_hash = hash_bytes(data)
+    pages = _read_cache(file_hash)
+    if pages is None:
+        pages, page_hashes, _ = extract(BytesIO(data), file_name)
+        _write_cache(file_hash, pages, page_hashes)
+    return pages